@@ -1,4 +1,25 @@
-HOTMART_BASE = "https://go.hotmart.com/"
+import config
 
-def generate_link(user_id):
-    return f"{HOTMART_BASE}?src=neuroforge_{user_id}"
+SRC_PREFIX = "neuroforge_"
+
+def generate_link(user_id, hotlink=None):
+    """Hotlink del producto con el `src` del usuario; None si no hay hotlink configurado"""
+    hotlink = config.HOTMART_HOTLINK if hotlink is None else hotlink
+    if not hotlink:
+        return None
+    separator = '&' if '?' in hotlink else '?'
+    return f"{hotlink}{separator}src={SRC_PREFIX}{user_id}"
+
+def parse_src(src):
+    """Usuario de Telegram dueño del link a partir del `src` de Hotmart (o None)"""
+    if not src or not src.startswith(SRC_PREFIX):
+        return None
+    try:
+        return int(src[len(SRC_PREFIX):])
+    except ValueError:
+        return None
+
+def purchase_src(data):
+    """`src` de tracking de un webhook de Hotmart"""
+    purchase = (data.get('data') or {}).get('purchase') or {}
+    return (purchase.get('origin') or {}).get('src')
@@ -0,0 +1,234 @@
+"""
+IMPORTADOR DE EXPORTS HISTÓRICOS DE HOTMART
+Uso: python -m affiliates.hotmart_import ventas.csv [otro.json ...] [--lote 5000]
+
+Acepta el CSV de ventas del panel de Hotmart (separador , o ; y cabeceras en
+español, portugués o inglés), JSON Lines o un array JSON (filas planas o
+payloads de webhook). Lee en streaming: la memoria no crece con el archivo.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+import config
+from database import get_pool
+from idempotency import event_key
+from ledger import ensure_schema, rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+APPROVED_EVENT = "PURCHASE_APPROVED"
+
+# Cabecera normalizada (minúsculas, sin acentos) -> campo
+COLUMNS = {
+    "transaccion": "transaccion", "transacao": "transaccion", "transaction": "transaccion",
+    "codigo de la transaccion": "transaccion", "codigo da transacao": "transaccion",
+    "producto": "producto", "produto": "producto", "product": "producto",
+    "nombre del producto": "producto", "nome do produto": "producto", "product name": "producto",
+    "comision": "comision", "comissao": "comision", "commission": "comision",
+    "mi comision": "comision", "minha comissao": "comision", "commission value": "comision",
+    "fecha": "fecha", "data": "fecha", "date": "fecha",
+    "fecha de compra": "fecha", "data da compra": "fecha", "purchase date": "fecha",
+    "fecha de aprobacion": "fecha", "data de aprovacao": "fecha", "approved date": "fecha",
+    "estado": "estado", "status": "estado", "estado de la transaccion": "estado",
+    "status da transacao": "estado", "transaction status": "estado",
+}
+
+# Estados que cuentan como venta (el resto: reembolsos, cancelaciones, pendientes...)
+APPROVED_STATUSES = {"approved", "aprobado", "aprobada", "aprovado", "aprovada",
+                     "complete", "completed", "completo", "completa", "completado", "completada"}
+
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y %H:%M:%S",
+                "%d/%m/%Y %H:%M", "%Y-%m-%d", "%d/%m/%Y")
+
+_ACCENTS = str.maketrans("áàâãéêíóôõúüç", "aaaaeeiooouuc")
+
+
+def _normalize(header):
+    return " ".join(header.strip().lower().translate(_ACCENTS).replace("_", " ").split())
+
+
+def parse_amount(value):
+    """'US$ 1.234,56', '1,234.56' o 48.5 -> float"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = "".join(ch for ch in str(value) if ch.isdigit() or ch in ",.-")
+    if "," in text and "." in text:
+        # El separador decimal es el último que aparece
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text:
+        text = text.replace(",", ".")
+    return float(text)
+
+
+def parse_date(value):
+    """Fecha del export -> 'YYYY-MM-DD HH:MM:SS' (como escribe el libro)"""
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        # Los webhooks traen milisegundos desde epoch
+        seconds = float(value) / (1000 if float(value) > 1e11 else 1)
+        return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    text = str(value).strip().replace("Z", "")[:19]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            continue
+    raise ValueError(f"fecha no reconocida: {value!r}")
+
+
+def iter_csv(f):
+    """Filas del CSV como dicts con los campos de COLUMNS"""
+    sample = f.read(4096)
+    f.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(f, dialect)
+    header = next(reader, None) or []
+    fields = [COLUMNS.get(_normalize(h)) for h in header]
+    for row in reader:
+        yield {field: value for field, value in zip(fields, row) if field}
+
+
+def iter_json(f, chunk_size=65536):
+    """Objetos de un array JSON o de JSON Lines, sin cargar el archivo entero"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    while True:
+        # Saltamos separadores entre objetos: corchetes, comas y espacios
+        while pos < len(buffer) and buffer[pos] in "[], \t\r\n":
+            pos += 1
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                if buffer[pos:].strip():
+                    raise
+                return
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield obj
+        pos = end
+
+
+def to_sale(record):
+    """(clave, producto, comision, fecha) o None si no es una venta aprobada"""
+    if "data" in record and isinstance(record["data"], dict):
+        # Payload de webhook guardado tal cual
+        if record.get("event") != APPROVED_EVENT:
+            return None
+        data = record["data"]
+        purchase = data.get("purchase") or {}
+        fecha = purchase.get("approved_date") or purchase.get("order_date") or record.get("creation_date")
+        return (event_key(record), data["product"]["name"], parse_amount(data["commission"]["value"]),
+                parse_date(fecha))
+
+    if "estado" not in record and "transaccion" not in record:
+        # Fila JSON plana: mismas cabeceras que el CSV
+        record = {COLUMNS[k]: v for k, v in ((_normalize(k), v) for k, v in record.items()) if k in COLUMNS}
+    estado = record.get("estado")
+    if estado and _normalize(estado) not in APPROVED_STATUSES:
+        return None
+    transaccion = (record.get("transaccion") or "").strip()
+    if not transaccion:
+        raise ValueError("fila sin transacción")
+    # Misma clave que un webhook de esa compra: importar y recibir el webhook no duplica
+    return (f"{APPROVED_EVENT}:{transaccion}", record["producto"], parse_amount(record["comision"]),
+            parse_date(record["fecha"]))
+
+
+def iter_sales(path, fmt="auto"):
+    if fmt == "auto":
+        fmt = "csv" if path.lower().endswith((".csv", ".tsv", ".txt")) else "json"
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        records = iter_csv(f) if fmt == "csv" else iter_json(f)
+        for record in records:
+            yield record
+
+
+class Importer:
+    """Inserta ventas en lotes grandes (INSERT OR IGNORE sobre la clave única del libro).
+
+    Los acumulados se recalculan una sola vez al final y su versión sube, así
+    que los procesos en marcha recargan el dashboard solos.
+    """
+
+    def __init__(self, db_path=config.LEDGER_DB, batch_size=5000, report_every=50000):
+        self.conn = get_pool(db_path).connection()
+        self.batch_size = batch_size
+        self.report_every = report_every
+        self.stats = {"leidas": 0, "nuevas": 0, "duplicadas": 0, "ignoradas": 0, "invalidas": 0}
+        ensure_schema(self.conn)
+
+    def _insert(self, batch):
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO ventas (clave, producto, comision, fecha) VALUES (?, ?, ?, ?)', batch
+            )
+        inserted = self.conn.total_changes - before
+        self.stats["nuevas"] += inserted
+        self.stats["duplicadas"] += len(batch) - inserted
+
+    def _report(self, start):
+        elapsed = time.monotonic() - start
+        rate = self.stats["leidas"] / elapsed if elapsed else 0.0
+        logger.info("📥 %s filas leídas, %s nuevas, %s duplicadas (%.0f filas/s)",
+                    self.stats['leidas'], self.stats['nuevas'], self.stats['duplicadas'], rate)
+
+    def run(self, paths, fmt="auto"):
+        start = time.monotonic()
+        batch = []
+        for path in paths:
+            logger.info("📂 Importando %s", path)
+            for record in iter_sales(path, fmt):
+                self.stats["leidas"] += 1
+                try:
+                    sale = to_sale(record)
+                except (KeyError, TypeError, ValueError) as e:
+                    self.stats["invalidas"] += 1
+                    if self.stats["invalidas"] <= 10:
+                        logger.warning("⚠️ Fila %s de %s descartada: %s", self.stats['leidas'], path, e)
+                    continue
+                if sale is None:
+                    self.stats["ignoradas"] += 1
+                    continue
+                batch.append(sale)
+                if len(batch) >= self.batch_size:
+                    self._insert(batch)
+                    batch = []
+                if self.stats["leidas"] % self.report_every == 0:
+                    self._report(start)
+        if batch:
+            self._insert(batch)
+        if self.stats["nuevas"]:
+            rebuild_rollups(self.conn)
+        self._report(start)
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa exports históricos de ventas de Hotmart al libro")
+    parser.add_argument("archivos", nargs="+")
+    parser.add_argument("--formato", choices=["auto", "csv", "json"], default="auto")
+    parser.add_argument("--lote", type=int, default=5000, help="Filas por transacción")
+    parser.add_argument("--db", default=config.LEDGER_DB)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    stats = Importer(args.db, args.lote).run(args.archivos, args.formato)
+    logger.info("✅ Importación terminada: %s", stats)
+
+
+if __name__ == "__main__":
+    main()
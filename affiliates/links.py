@@ -0,0 +1,119 @@
+"""
+SERVICIO DE LINKS DE AFILIADO
+Uso: python -m affiliates.links pregenerar [--chunk 1000]
+"""
+
+import argparse
+import logging
+import time
+
+import config
+from affiliates import hotmart
+from cache import LRUCache
+from database import DEFAULT_DB, get_pool
+
+logger = logging.getLogger(__name__)
+
+GENERATORS = {
+    "hotmart": hotmart.generate_link,
+}
+
+# Sin hotlink configurado no hay link con tracking: se ofrece el del curso (sin guardarlo)
+FALLBACK_URLS = {
+    "hotmart": config.COURSE_URL,
+}
+
+UPSERT_LINK = (
+    'INSERT INTO links (telegram_id, platform, url) VALUES (?, ?, ?) '
+    'ON CONFLICT(telegram_id, platform) DO UPDATE SET url = excluded.url '
+    'WHERE links.url IS NOT excluded.url'
+)
+
+
+class LinkService:
+    """Link de afiliado por usuario: LRU en memoria delante de la tabla `links`"""
+
+    def __init__(self, db_path=DEFAULT_DB, cache_size=50000):
+        self._pool = get_pool(db_path)
+        self._cache = LRUCache(cache_size)
+        self._ready = False
+
+    def init_db(self):
+        with self._pool.transaction() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_links_user_platform'"
+            ).fetchone()
+            if exists is None:
+                # El índice único exige que no haya duplicados previos: se conserva el
+                # primero. Solo hace falta la primera vez (luego el índice los impide)
+                conn.execute('''
+                    DELETE FROM links WHERE id NOT IN (
+                        SELECT MIN(id) FROM links GROUP BY telegram_id, platform
+                    )
+                ''')
+                conn.execute(
+                    'CREATE UNIQUE INDEX IF NOT EXISTS idx_links_user_platform ON links (telegram_id, platform)'
+                )
+        self._ready = True
+
+    def get_or_create(self, telegram_id, platform="hotmart"):
+        key = (telegram_id, platform)
+        url = self._cache.get(key)
+        if url is not None:
+            return url
+        if not self._ready:
+            self.init_db()
+
+        url = GENERATORS[platform](telegram_id)
+        if url is None:
+            return FALLBACK_URLS[platform]
+        # El link se deriva del hotlink actual: si cambió (o era de un formato sin
+        # producto), la fila guardada se corrige; si no, no se escribe nada
+        with self._pool.transaction() as conn:
+            conn.execute(UPSERT_LINK, (telegram_id, platform, url))
+        self._cache.put(key, url)
+        return url
+
+    def pregenerate(self, platform="hotmart", chunk_size=1000):
+        """Crea los links de todos los `users` recorriéndolos por id, una transacción por bloque"""
+        if not self._ready:
+            self.init_db()
+        generate = GENERATORS[platform]
+        if generate(0) is None:
+            logger.warning("⚠️ Sin hotlink configurado para %s: no hay links que pregenerar.", platform)
+            return 0
+        conn = self._pool.connection()
+        last_id, created, start = 0, 0, time.monotonic()
+        while True:
+            rows = conn.execute(
+                'SELECT id, telegram_id FROM users WHERE id > ? ORDER BY id LIMIT ?',
+                (last_id, chunk_size),
+            ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            with self._pool.transaction() as tx:
+                cur = tx.executemany(
+                    UPSERT_LINK,
+                    [(telegram_id, platform, generate(telegram_id)) for _, telegram_id in rows],
+                )
+            created += cur.rowcount
+            logger.info("🔗 %s links creados o corregidos (usuario %s)", created, last_id)
+        logger.info("✅ Pregeneración completada: %s links en %.1fs", created, time.monotonic() - start)
+        return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio de links de afiliado")
+    parser.add_argument("accion", choices=["pregenerar"])
+    parser.add_argument("--platform", default="hotmart", choices=sorted(GENERATORS))
+    parser.add_argument("--chunk", type=int, default=1000)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    LinkService(args.db).pregenerate(args.platform, args.chunk)
+
+
+if __name__ == "__main__":
+    main()
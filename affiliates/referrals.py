@@ -0,0 +1,160 @@
+"""
+MOTOR DE REFERIDOS (tabla de clausura)
+Uso: python -m affiliates.referrals reconstruir
+"""
+
+import argparse
+import logging
+import time
+
+import config
+from database import DEFAULT_DB, get_pool, init_db
+
+logger = logging.getLogger(__name__)
+
+# Profundidad máxima de la cadena: corta también cualquier ciclo en referred_by
+MAX_DEPTH = 64
+
+
+def referral_code(user_id):
+    return f"ref{user_id}"
+
+
+def parse_referral(code):
+    """Usuario que refirió a partir del parámetro de /start (`ref123`), o None"""
+    if not code or not code.startswith("ref"):
+        return None
+    try:
+        return int(code[3:])
+    except ValueError:
+        return None
+
+
+class ReferralEngine:
+    """Jerarquía de referidos como tabla de clausura (ancestor, descendant, depth).
+
+    Cada afiliado tiene una fila por ancestro (incluido él mismo, depth 0),
+    así que la línea ascendente completa sale de una sola consulta indexada.
+    """
+
+    def __init__(self, rates, db_path=DEFAULT_DB):
+        # rates[0] es lo que cobra el dueño del link; rates[n], su ancestro de nivel n.
+        # Se reparte la comisión recibida: entre todos no pueden pasar del 100%
+        if sum(rates) > 1.0 + 1e-9:
+            raise ValueError(f"Las tasas de referidos suman {sum(rates):.2f} (> 1.0): {rates}")
+        self.rates = list(rates)
+        self._pool = get_pool(db_path)
+        self._ready = False
+
+    def init_db(self):
+        init_db(self._pool.path)
+        with self._pool.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS affiliate_tree (
+                    ancestor INTEGER NOT NULL,
+                    descendant INTEGER NOT NULL,
+                    depth INTEGER NOT NULL,
+                    PRIMARY KEY (descendant, depth)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_affiliate_tree_ancestor ON affiliate_tree (ancestor, depth)'
+            )
+            # Una fila por venta acreditada (clave de idempotency.event_key): reintentos sin doble abono
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS referral_credits (
+                    sale_key TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    commission REAL NOT NULL,
+                    credited_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID
+            ''')
+        self._ready = True
+
+    def _transaction(self):
+        if not self._ready:
+            self.init_db()
+        return self._pool.transaction()
+
+    def join(self, user_id, referred_by=None):
+        """Da de alta al afiliado y hereda la cadena de su referente; devuelve True si es nuevo"""
+        if referred_by == user_id:
+            referred_by = None
+        with self._transaction() as conn:
+            if referred_by is not None and conn.execute(
+                'SELECT 1 FROM affiliates WHERE user_id = ?', (referred_by,)
+            ).fetchone() is None:
+                referred_by = None
+            cur = conn.execute(
+                'INSERT OR IGNORE INTO affiliates (user_id, referral_code, referred_by) VALUES (?, ?, ?)',
+                (user_id, referral_code(user_id), referred_by),
+            )
+            if cur.rowcount == 0:
+                return False
+            conn.execute(
+                'INSERT INTO affiliate_tree (ancestor, descendant, depth) VALUES (?, ?, 0)',
+                (user_id, user_id),
+            )
+            if referred_by is not None:
+                conn.execute('''
+                    INSERT INTO affiliate_tree (ancestor, descendant, depth)
+                    SELECT ancestor, ?, depth + 1 FROM affiliate_tree
+                    WHERE descendant = ? AND depth < ?
+                ''', (user_id, referred_by, MAX_DEPTH))
+        return True
+
+    def credit_sale(self, user_id, commission, key=None):
+        """Reparte la comisión por toda la línea: una consulta + un executemany en una transacción.
+
+        Con `key` la venta se abona una sola vez: devuelve None si ya estaba acreditada.
+        """
+        with self._transaction() as conn:
+            if key is not None:
+                cur = conn.execute(
+                    'INSERT OR IGNORE INTO referral_credits (sale_key, user_id, commission) VALUES (?, ?, ?)',
+                    (key, user_id, commission),
+                )
+                if cur.rowcount == 0:
+                    return None
+            chain = conn.execute(
+                'SELECT ancestor, depth FROM affiliate_tree WHERE descendant = ? AND depth < ?',
+                (user_id, len(self.rates)),
+            ).fetchall()
+            credits = [(commission * self.rates[depth], ancestor) for ancestor, depth in chain]
+            conn.executemany('UPDATE affiliates SET balance = balance + ? WHERE user_id = ?', credits)
+        return credits
+
+    def rebuild(self):
+        """Recalcula toda la tabla de clausura desde `referred_by` en una sola pasada recursiva"""
+        start = time.monotonic()
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM affiliate_tree')
+            before = conn.total_changes
+            conn.execute('''
+                WITH RECURSIVE chain (ancestor, descendant, depth) AS (
+                    SELECT user_id, user_id, 0 FROM affiliates
+                    UNION ALL
+                    SELECT a.referred_by, chain.descendant, chain.depth + 1
+                    FROM chain JOIN affiliates a ON a.user_id = chain.ancestor
+                    WHERE a.referred_by IS NOT NULL AND chain.depth < ?
+                )
+                INSERT INTO affiliate_tree (ancestor, descendant, depth)
+                SELECT ancestor, descendant, depth FROM chain
+            ''', (MAX_DEPTH,))
+            rows = conn.total_changes - before
+        logger.info("✅ Tabla de referidos reconstruida: %s filas en %.1fs", rows, time.monotonic() - start)
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motor de referidos")
+    parser.add_argument("accion", choices=["reconstruir"])
+    parser.add_argument("--db", default=DEFAULT_DB)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ReferralEngine(config.REFERRAL_RATES, args.db).rebuild()
+
+
+if __name__ == "__main__":
+    main()
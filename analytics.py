@@ -0,0 +1,247 @@
+"""
+EMBUDO DE CONVERSIÓN: /start -> /link -> /info -> compra
+Uso:
+    python analytics.py embudo [--dias 7]
+    python analytics.py serie [--por dia|hora] [--dias 7]
+    python analytics.py compactar
+"""
+
+import argparse
+import logging
+import threading
+import time
+from collections import deque
+
+import config
+from database import DEFAULT_DB, get_pool
+
+logger = logging.getLogger(__name__)
+
+# Eventos del embudo como enteros: la tabla cruda guarda 3 enteros por fila
+EVENTS = {"start": 1, "link": 2, "info": 3, "otros": 4, "purchase": 5}
+EVENT_NAMES = {code: name for name, code in EVENTS.items()}
+FUNNEL = ("start", "link", "info", "purchase")
+
+HOUR = 3600
+DAY = 86400
+LATE_SECONDS = 120
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS analytics_events (
+        id INTEGER PRIMARY KEY,
+        ts INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        event INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_analytics_events_ts ON analytics_events (ts);
+    CREATE TABLE IF NOT EXISTS analytics_hourly (
+        bucket INTEGER NOT NULL,
+        event INTEGER NOT NULL,
+        events INTEGER NOT NULL,
+        users INTEGER NOT NULL,
+        PRIMARY KEY (bucket, event)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS analytics_daily (
+        bucket INTEGER NOT NULL,
+        event INTEGER NOT NULL,
+        events INTEGER NOT NULL,
+        users INTEGER NOT NULL,
+        PRIMARY KEY (bucket, event)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS analytics_users (
+        user_id INTEGER PRIMARY KEY,
+        first_start INTEGER,
+        first_link INTEGER,
+        first_info INTEGER,
+        first_purchase INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_analytics_users_start ON analytics_users (first_start);
+    CREATE TABLE IF NOT EXISTS analytics_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        hourly_until INTEGER NOT NULL,
+        daily_until INTEGER NOT NULL
+    );
+'''
+
+ROLLUP = '''
+    INSERT OR REPLACE INTO {table} (bucket, event, events, users)
+    SELECT ts - ts % {size}, event, COUNT(*), COUNT(DISTINCT user_id)
+    FROM analytics_events WHERE ts >= ? AND ts < ?
+    GROUP BY ts - ts % {size}, event
+'''
+
+# Primera vez que cada usuario pasó por cada paso: el embudo por cohorte sale de aquí
+FIRST_SEEN = '''
+    INSERT INTO analytics_users (user_id, first_start, first_link, first_info, first_purchase)
+    SELECT user_id,
+           MIN(CASE WHEN event = 1 THEN ts END), MIN(CASE WHEN event = 2 THEN ts END),
+           MIN(CASE WHEN event = 3 THEN ts END), MIN(CASE WHEN event = 5 THEN ts END)
+    FROM analytics_events WHERE ts >= ? AND ts < ?
+    GROUP BY user_id
+    ON CONFLICT(user_id) DO UPDATE SET
+        first_start = COALESCE(first_start, excluded.first_start),
+        first_link = COALESCE(first_link, excluded.first_link),
+        first_info = COALESCE(first_info, excluded.first_info),
+        first_purchase = COALESCE(first_purchase, excluded.first_purchase)
+'''
+
+
+class Analytics:
+    """Registro de eventos del embudo con buffer circular y acumulados por hora y día.
+
+    `track` solo añade una tupla a un deque (sin locks ni E/S). Un hilo vuelca
+    el buffer cada `flush_seconds` con un `executemany` a `analytics_events`,
+    que es solo de inserción. La compactación resume las horas y días ya
+    cerrados en `analytics_hourly`/`analytics_daily` y la primera vez de cada
+    usuario en `analytics_users`; los eventos crudos se borran pasada la
+    retención. Las consultas leen solo esas tablas pequeñas.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, buffer_size=10000, flush_seconds=5.0,
+                 compact_seconds=300, retention_days=30):
+        self.flush_seconds = flush_seconds
+        self.compact_seconds = compact_seconds
+        self.retention = retention_days * DAY
+        self.dropped = 0
+        self._buffer = deque(maxlen=buffer_size)
+        self._pool = get_pool(db_path)
+        self._ready = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_db(self):
+        conn = self._pool.connection()
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.execute('INSERT OR IGNORE INTO analytics_meta (id, hourly_until, daily_until) VALUES (1, 0, 0)')
+        self._ready = True
+
+    def _connection(self):
+        if not self._ready:
+            self.init_db()
+        return self._pool.connection()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="analytics", daemon=True)
+                self._thread.start()
+
+    def track(self, user_id, event, ts=None):
+        """Anota un evento del embudo; los nombres desconocidos se ignoran"""
+        code = EVENTS.get(event)
+        if code is None or user_id is None:
+            return
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            # Buffer lleno (la base no da abasto): se pierde el evento más viejo
+            self.dropped += 1
+        buffer.append((int(ts if ts is not None else time.time()), user_id, code))
+
+    def flush(self):
+        """Vuelca el buffer a `analytics_events`; devuelve cuántos eventos escribió"""
+        buffer = self._buffer
+        rows = [buffer.popleft() for _ in range(len(buffer))]
+        if rows:
+            conn = self._connection()
+            with conn:
+                conn.executemany('INSERT INTO analytics_events (ts, user_id, event) VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def compact(self, now=None):
+        """Resume las horas y días cerrados desde la última compactación"""
+        # Margen para eventos que otro worker aún tiene en su buffer
+        closed = int(now if now is not None else time.time()) - LATE_SECONDS
+        hour, day = closed - closed % HOUR, closed - closed % DAY
+        conn = self._connection()
+        with conn:
+            # IMMEDIATE: dos workers no compactan el mismo rango
+            conn.execute('BEGIN IMMEDIATE')
+            hourly_until, daily_until = conn.execute(
+                'SELECT hourly_until, daily_until FROM analytics_meta WHERE id = 1'
+            ).fetchone()
+            if hourly_until < hour:
+                conn.execute(ROLLUP.format(table='analytics_hourly', size=HOUR), (hourly_until, hour))
+                conn.execute(FIRST_SEEN, (hourly_until, hour))
+                hourly_until = hour
+            if daily_until < day:
+                conn.execute(ROLLUP.format(table='analytics_daily', size=DAY), (daily_until, day))
+                daily_until = day
+            conn.execute('UPDATE analytics_meta SET hourly_until = ?, daily_until = ? WHERE id = 1',
+                         (hourly_until, daily_until))
+            # Lo crudo ya resumido se conserva solo durante la retención
+            cur = conn.execute('DELETE FROM analytics_events WHERE ts < ?',
+                               (min(hourly_until, daily_until, closed - self.retention),))
+        if cur.rowcount:
+            logger.info("🧹 %s eventos de analítica antiguos eliminados.", cur.rowcount)
+
+    def _run(self):
+        last_compact = 0.0
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+                if time.monotonic() - last_compact >= self.compact_seconds:
+                    last_compact = time.monotonic()
+                    self.compact()
+            except Exception as e:
+                logger.error("❌ Error guardando analítica: %s", e)
+
+    def funnel(self, since, until=None):
+        """Usuarios que hicieron /start en [since, until) y cuántos llegaron a cada paso"""
+        until = until if until is not None else time.time()
+        row = self._connection().execute('''
+            SELECT COUNT(*), COUNT(first_link), COUNT(first_info), COUNT(first_purchase)
+            FROM analytics_users WHERE first_start >= ? AND first_start < ?
+        ''', (int(since), int(until))).fetchone()
+        return dict(zip(FUNNEL, row))
+
+    def series(self, since, until=None, granularity="day"):
+        """[(bucket, evento, eventos, usuarios únicos)] desde los acumulados"""
+        table = 'analytics_daily' if granularity == "day" else 'analytics_hourly'
+        until = until if until is not None else time.time()
+        rows = self._connection().execute(
+            f'SELECT bucket, event, events, users FROM {table} WHERE bucket >= ? AND bucket < ? ORDER BY bucket, event',
+            (int(since), int(until)),
+        ).fetchall()
+        return [(bucket, EVENT_NAMES.get(event, event), events, users) for bucket, event, events, users in rows]
+
+
+analytics = Analytics(
+    buffer_size=config.ANALYTICS_BUFFER_SIZE,
+    flush_seconds=config.ANALYTICS_FLUSH_SECONDS,
+    retention_days=config.ANALYTICS_RETENTION_DAYS,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embudo de conversión del bot")
+    sub = parser.add_subparsers(dest="accion", required=True)
+    embudo = sub.add_parser("embudo")
+    embudo.add_argument("--dias", type=int, default=7)
+    serie = sub.add_parser("serie")
+    serie.add_argument("--por", choices=["dia", "hora"], default="dia")
+    serie.add_argument("--dias", type=int, default=7)
+    sub.add_parser("compactar")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.accion == "compactar":
+        analytics.compact()
+        return
+    analytics.compact()
+    since = time.time() - args.dias * DAY
+    if args.accion == "embudo":
+        pasos = analytics.funnel(since)
+        base = pasos["start"] or 1
+        for paso in FUNNEL:
+            print(f"{paso:10} {pasos[paso]:>8}  {pasos[paso] / base:6.1%}")
+    else:
+        granularity = "day" if args.por == "dia" else "hour"
+        fmt = '%Y-%m-%d' if granularity == "day" else '%Y-%m-%d %H:00'
+        for bucket, event, events, users in analytics.series(since, granularity=granularity):
+            print(f"{time.strftime(fmt, time.gmtime(bucket))}  {event:10} {events:>8} eventos  {users:>8} usuarios")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+RUNTIME ASYNCIO DEL BOT (alternativa a main.py para pruebas locales o hosts sin URL pública)
+Uso:
+    python async_bot.py polling
+    python async_bot.py webhook [--port 10000] [--url https://mi-app.onrender.com]
+
+Usa los mismos handlers que main.py (router.CommandRouter). Una sola sesión
+aiohttp para la Bot API, cada chat en orden y los chats distintos en paralelo,
+todo en un hilo: las esperas de red no ocupan hilos. En modo webhook también
+atiende /hotmart-webhook con la misma validación y outbox que main.py.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+import config
+import main
+from logs import SAMPLE
+from metrics import TELEGRAM_ERRORS, TELEGRAM_LATENCY
+from security import MemoryLimiter
+from sender import SendError, TokenBucket, parse_error, retry_delay
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTelegramSender:
+    """Equivalente asyncio de sender.TelegramSender: mismos límites, 429 y reintentos"""
+
+    def __init__(self, token, api_url="https://api.telegram.org", global_rate=30, chat_rate=1,
+                 chat_burst=1, pool_size=100, max_retries=3, timeout=10, max_chats=10000):
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}"
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_chats = max_chats
+        self.session = None
+        self._global = TokenBucket(global_rate)
+        self._chats = OrderedDict()
+        self.counters = {"sent": 0, "throttled": 0, "retried": 0, "failed": 0}
+
+    async def start(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _chat_bucket(self, chat_id):
+        # Un solo hilo (el del loop): no hace falta lock
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire(self, bucket):
+        wait = bucket.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def call(self, method, payload, chat_id=None, timeout=None):
+        """Llama a un método de la Bot API respetando límites y retry_after"""
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                await self._acquire(self._chat_bucket(chat_id))
+            await self._acquire(self._global)
+            start = time.perf_counter()
+            try:
+                async with self.session.post(
+                    f"{self.base_url}/{method}", json=payload,
+                    timeout=aiohttp.ClientTimeout(total=timeout or self.timeout),
+                ) as resp:
+                    data = await resp.json(content_type=None)
+                    status = resp.status
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error_code, description, retry_after = 0, str(e) or type(e).__name__, None
+            else:
+                TELEGRAM_LATENCY.labels(method).observe(time.perf_counter() - start)
+                if data.get("ok"):
+                    return data.get("result")
+                error_code, description, retry_after = parse_error(data, status)
+
+            TELEGRAM_ERRORS.labels(method, error_code).inc()
+            if error_code == 429:
+                self.counters["throttled"] += 1
+            attempt += 1
+            delay = retry_delay(error_code, retry_after, attempt, self.max_retries)
+            if delay is None:
+                self.counters["failed"] += 1
+                raise SendError(error_code, description)
+
+            self.counters["retried"] += 1
+            logger.warning("⏳ Telegram %s error %s, reintento %s en %.2fs", method, error_code, attempt, delay)
+            await asyncio.sleep(delay)
+
+    async def send_prepared(self, chat_id, prepared, reply_to_message_id=None):
+        payload = prepared.copy()
+        payload["chat_id"] = chat_id
+        if reply_to_message_id:
+            payload["reply_to_message_id"] = reply_to_message_id
+        result = await self.call("sendMessage", payload, chat_id=chat_id)
+        self.counters["sent"] += 1
+        return result
+
+
+class AsyncBot:
+    """Procesa updates en asyncio con orden por chat.
+
+    Cada chat tiene su cola (deque) y como mucho una tarea que la vacía; al
+    quedar vacía la tarea termina y el chat desaparece del dict, así que la
+    memoria depende de los chats activos, no de los totales. Un semáforo
+    limita cuántos updates se procesan a la vez. Las respuestas fijas se
+    envían sin salir del loop; el limitador por usuario y los handlers con
+    SQLite corren en un pool pequeño de hilos y la respuesta se envía de
+    vuelta en el loop.
+    """
+
+    def __init__(self, router, sender, concurrency=1000, handler_threads=4):
+        self.router = router
+        self.sender = sender
+        self.offset = None
+        self._chats = {}
+        self._slots = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=handler_threads, thread_name_prefix="async-handlers")
+
+    def submit(self, update):
+        """Encola un update (ya deduplicado) en la cola de su chat"""
+        chat_id = main.update_chat_id(update)
+        pending = self._chats.get(chat_id)
+        if pending is not None:
+            pending.append(update)
+            return
+        self._chats[chat_id] = deque([update])
+        asyncio.get_running_loop().create_task(self._drain(chat_id))
+
+    def pending(self):
+        return sum(len(q) for q in self._chats.values())
+
+    async def _drain(self, chat_id):
+        queue = self._chats[chat_id]
+        try:
+            while queue:
+                update = queue.popleft()
+                async with self._slots:
+                    try:
+                        await self._process(update)
+                    except Exception as e:
+                        logger.error("❌ Error procesando update %s: %s", update.get('update_id'), e)
+        finally:
+            del self._chats[chat_id]
+
+    async def _process(self, update):
+        loop = asyncio.get_running_loop()
+        user_id = main.update_user_id(update)
+        if user_id is None:
+            allowed = True
+        elif isinstance(main.limiter, MemoryLimiter):
+            allowed = main.limiter.allow(user_id)
+        else:
+            # RATE_LIMIT_BACKEND=sqlite escribe con BEGIN IMMEDIATE: fuera del loop, como los handlers
+            allowed = await loop.run_in_executor(self._executor, main.limiter.allow, user_id)
+        if not allowed:
+            logger.info("⏱️ Usuario %s limitado por cooldown.", user_id, extra=SAMPLE)
+            aviso = main.cooldown_reply(user_id)
+            message = update.get('message')
+            if aviso is not None and message is not None:
+                await self.sender.send_prepared(message['chat']['id'], aviso,
+                                                reply_to_message_id=message['message_id'])
+            return
+        resolved = self.router.resolve(update)
+        if resolved is None:
+            return
+        message, route, args = resolved
+        start = time.perf_counter()
+        try:
+            if route.handler is None:
+                payload = route.payload
+            else:
+                payload = await loop.run_in_executor(self._executor, route.respond, message, args)
+            if payload is not None:
+                await self.sender.send_prepared(message['chat']['id'], payload,
+                                                reply_to_message_id=message['message_id'])
+        finally:
+            route.latency.observe(time.perf_counter() - start)
+
+    def accept(self, update):
+        """Deduplica por update_id (reentregas) y encola; False si ya se había visto"""
+        if not main.seen_updates.add(update['update_id']):
+            return False
+        self.submit(update)
+        return True
+
+    async def poll(self, timeout=50):
+        """Long polling con getUpdates; el offset confirma lo recibido a Telegram"""
+        # Con webhook activo Telegram rechaza getUpdates
+        await self.sender.call('deleteWebhook', {})
+        logger.info("📡 Long polling iniciado.")
+        while True:
+            payload = {"timeout": timeout, "allowed_updates": ["message"]}
+            if self.offset is not None:
+                payload["offset"] = self.offset
+            try:
+                updates = await self.sender.call('getUpdates', payload, timeout=timeout + 10)
+            except SendError as e:
+                logger.error("❌ getUpdates falló: %s %s", e.error_code, e.description)
+                await asyncio.sleep(5)
+                continue
+            for update in updates:
+                self.offset = update['update_id'] + 1
+                self.accept(update)
+
+    def webhook_app(self):
+        async def telegram_webhook(request):
+            if request.content_type != 'application/json':
+                return web.Response(status=403, text='forbidden')
+            try:
+                update = await request.json()
+                update['update_id']
+            except (ValueError, KeyError, TypeError):
+                return web.Response(status=400, text='bad request')
+            self.accept(update)
+            return web.Response(text='ok')
+
+        async def hotmart_webhook(request):
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+            # Outbox e idempotencia escriben en SQLite: fuera del loop
+            loop = asyncio.get_running_loop()
+            body, status = await loop.run_in_executor(self._executor, main.recibir_venta, data)
+            return web.json_response(body, status=status)
+
+        async def home(request):
+            return web.Response(text="🚀 NEURAFORGEA BOT OPERATIVO (asyncio)")
+
+        app = web.Application()
+        app.router.add_post('/telegram-webhook', telegram_webhook)
+        app.router.add_post('/hotmart-webhook', hotmart_webhook)
+        app.router.add_get('/', home)
+        return app
+
+
+def create_sender():
+    return AsyncTelegramSender(
+        main.TELEGRAM_TOKEN,
+        api_url=config.TELEGRAM_API_URL,
+        global_rate=config.TELEGRAM_GLOBAL_RATE,
+        chat_rate=config.TELEGRAM_CHAT_RATE,
+        pool_size=config.ASYNC_POOL_SIZE,
+        max_retries=config.TELEGRAM_MAX_RETRIES,
+    )
+
+
+async def run_polling():
+    sender = create_sender()
+    await sender.start()
+    bot = AsyncBot(main.router, sender, concurrency=config.ASYNC_CONCURRENCY)
+    try:
+        await bot.poll()
+    finally:
+        await sender.close()
+
+
+async def run_webhook(port, url=None):
+    sender = create_sender()
+    await sender.start()
+    bot = AsyncBot(main.router, sender, concurrency=config.ASYNC_CONCURRENCY)
+    runner = web.AppRunner(bot.webhook_app())
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    logger.info("🌐 Webhook asyncio escuchando en el puerto %s", port)
+    if url:
+        # Misma lógica que main: solo se cambia si Telegram tiene otra URL
+        await asyncio.get_running_loop().run_in_executor(None, main.ensure_webhook, f"{url}/telegram-webhook")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await sender.close()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Bot en asyncio (long polling o webhook)")
+    sub = parser.add_subparsers(dest="modo", required=True)
+    sub.add_parser("polling", help="solo Telegram (long polling); sin ventas de Hotmart")
+    webhook = sub.add_parser("webhook", help="/telegram-webhook y /hotmart-webhook")
+    webhook.add_argument("--port", type=int, default=int(os.environ.get('PORT', 10000)))
+    webhook.add_argument("--url", default=os.getenv('RENDER_EXTERNAL_URL'))
+    args = parser.parse_args()
+
+    # Hilos de fondo compartidos con main (recordatorios, analítica, difusiones pendientes)
+    main.start_background()
+    try:
+        if args.modo == "polling":
+            asyncio.run(run_polling())
+        else:
+            asyncio.run(run_webhook(args.port, args.url))
+    except KeyboardInterrupt:
+        logger.info("👋 Bot detenido.")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,239 @@
+"""
+DIFUSIÓN MASIVA A TODOS LOS USUARIOS
+Uso:
+    python broadcast.py enviar "Texto del mensaje" [--html]
+    python broadcast.py reanudar
+    python broadcast.py estado ID
+"""
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from database import DEFAULT_DB, get_pool, init_db
+from sender import SendError, TelegramSender, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        text TEXT NOT NULL,
+        parse_mode TEXT,
+        status TEXT NOT NULL DEFAULT 'running',
+        last_user_id INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        blocked INTEGER NOT NULL DEFAULT 0,
+        owner TEXT,
+        lease_until REAL NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+        broadcast_id INTEGER NOT NULL,
+        telegram_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        error TEXT,
+        PRIMARY KEY (broadcast_id, telegram_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS blocked_users (
+        telegram_id INTEGER PRIMARY KEY,
+        blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+# Errores que significan que el usuario ya no puede recibir mensajes del bot
+BLOCKED_CODES = (403,)
+
+
+class BroadcastEngine:
+    """Envía un mensaje a toda la tabla `users` en páginas por id (keyset).
+
+    Cada página se envía en paralelo (el sender respeta los límites de
+    Telegram) y al terminarla se guardan en una transacción los estados de
+    entrega y el último id procesado. Si el proceso muere, `run` continúa
+    desde ese punto; como mucho se repite la página que estaba en curso.
+    Un lease en la fila evita que dos workers procesen la misma difusión.
+    """
+
+    def __init__(self, sender, db_path=DEFAULT_DB, page_size=200, concurrency=8, lease_seconds=60, rate=None):
+        self.sender = sender
+        # Con un sender compartido (el del bot) la difusión tiene su propio tope: así
+        # no se come todo el límite global y las respuestas interactivas siguen saliendo
+        self._bucket = TokenBucket(rate) if rate else None
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        self._pool = get_pool(db_path)
+        self._ready = False
+
+    def init_db(self):
+        init_db(self._pool.path)
+        self._pool.connection().executescript(SCHEMA)
+        self._ready = True
+
+    def _connection(self):
+        if not self._ready:
+            self.init_db()
+        return self._pool.connection()
+
+    def create(self, text, parse_mode=None):
+        self._connection()
+        with self._pool.transaction() as conn:
+            cur = conn.execute('INSERT INTO broadcasts (text, parse_mode) VALUES (?, ?)', (text, parse_mode))
+        return cur.lastrowid
+
+    def status(self, broadcast_id):
+        row = self._connection().execute(
+            'SELECT id, status, last_user_id, sent, failed, blocked, created_at, updated_at '
+            'FROM broadcasts WHERE id = ?', (broadcast_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'status', 'last_user_id', 'sent', 'failed', 'blocked', 'created_at', 'updated_at')
+        return dict(zip(keys, row))
+
+    def _claim(self, broadcast_id):
+        now = time.time()
+        with self._pool.transaction() as conn:
+            cur = conn.execute(
+                "UPDATE broadcasts SET owner = ?, lease_until = ? "
+                "WHERE id = ? AND status = 'running' AND (lease_until < ? OR owner = ?)",
+                (self.owner, now + self.lease_seconds, broadcast_id, now, self.owner),
+            )
+        return cur.rowcount == 1
+
+    def _recipients(self, after_id):
+        return self._pool.connection().execute('''
+            SELECT u.id, u.telegram_id FROM users u
+            WHERE u.id > ?
+              AND NOT EXISTS (SELECT 1 FROM blocked_users b WHERE b.telegram_id = u.telegram_id)
+            ORDER BY u.id LIMIT ?
+        ''', (after_id, self.page_size)).fetchall()
+
+    def _deliver(self, job):
+        telegram_id, text, parse_mode = job
+        if self._bucket is not None:
+            self._bucket.acquire()
+        try:
+            self.sender.send_message(telegram_id, text, parse_mode=parse_mode)
+            return telegram_id, 'sent', None
+        except SendError as e:
+            status = 'blocked' if e.error_code in BLOCKED_CODES else 'failed'
+            return telegram_id, status, e.description
+        except Exception as e:
+            return telegram_id, 'failed', str(e)
+
+    def run(self, broadcast_id):
+        """Envía (o reanuda) una difusión; devuelve su estado final"""
+        conn = self._connection()
+        if not self._claim(broadcast_id):
+            logger.info("📭 Difusión %s terminada o en curso en otro proceso.", broadcast_id)
+            return self.status(broadcast_id)
+
+        text, parse_mode, last_id = conn.execute(
+            'SELECT text, parse_mode, last_user_id FROM broadcasts WHERE id = ?', (broadcast_id,)
+        ).fetchone()
+        pending = conn.execute('''
+            SELECT COUNT(*) FROM users u WHERE u.id > ?
+              AND NOT EXISTS (SELECT 1 FROM blocked_users b WHERE b.telegram_id = u.telegram_id)
+        ''', (last_id,)).fetchone()[0]
+        done, start = 0, time.monotonic()
+        logger.info("📣 Difusión %s: %s destinatarios desde el usuario %s", broadcast_id, pending, last_id)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="broadcast") as executor:
+            while True:
+                rows = self._recipients(last_id)
+                if not rows:
+                    break
+                results = list(executor.map(self._deliver, [(tid, text, parse_mode) for _, tid in rows]))
+                last_id = rows[-1][0]
+                counts = {'sent': 0, 'failed': 0, 'blocked': 0}
+                for _, status, _ in results:
+                    counts[status] += 1
+
+                with self._pool.transaction() as tx:
+                    tx.executemany(
+                        'INSERT OR REPLACE INTO broadcast_deliveries (broadcast_id, telegram_id, status, error) '
+                        'VALUES (?, ?, ?, ?)',
+                        [(broadcast_id, tid, status, error) for tid, status, error in results],
+                    )
+                    tx.executemany(
+                        'INSERT OR IGNORE INTO blocked_users (telegram_id) VALUES (?)',
+                        [(tid,) for tid, status, _ in results if status == 'blocked'],
+                    )
+                    cur = tx.execute('''
+                        UPDATE broadcasts SET last_user_id = ?, sent = sent + ?, failed = failed + ?,
+                            blocked = blocked + ?, lease_until = ?, updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ? AND owner = ?
+                    ''', (last_id, counts['sent'], counts['failed'], counts['blocked'],
+                          time.time() + self.lease_seconds, broadcast_id, self.owner))
+                if cur.rowcount == 0:
+                    logger.warning("⚠️ Difusión %s: otro proceso tomó el relevo.", broadcast_id)
+                    return self.status(broadcast_id)
+
+                done += len(rows)
+                elapsed = time.monotonic() - start
+                rate = done / elapsed if elapsed else 0.0
+                eta = (pending - done) / rate if rate else 0.0
+                logger.info("📣 Difusión %s: %s/%s (%.1f msg/s, ETA %.0fs)",
+                            broadcast_id, done, pending, rate, max(eta, 0))
+
+        with self._pool.transaction() as tx:
+            tx.execute(
+                "UPDATE broadcasts SET status = 'done', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND owner = ?",
+                (broadcast_id, self.owner),
+            )
+        logger.info("✅ Difusión %s completada en %.0fs", broadcast_id, time.monotonic() - start)
+        return self.status(broadcast_id)
+
+    def resume_pending(self):
+        """Reanuda las difusiones que quedaron a medias (caída o redeploy)"""
+        ids = [row[0] for row in self._connection().execute(
+            "SELECT id FROM broadcasts WHERE status = 'running' AND lease_until < ? ORDER BY id", (time.time(),)
+        )]
+        return [self.run(broadcast_id) for broadcast_id in ids]
+
+
+def create_engine():
+    sender = TelegramSender(
+        config.TELEGRAM_TOKEN,
+        api_url=config.TELEGRAM_API_URL,
+        global_rate=config.BROADCAST_RATE,
+        chat_rate=config.TELEGRAM_CHAT_RATE,
+        pool_size=config.BROADCAST_CONCURRENCY,
+        max_retries=config.TELEGRAM_MAX_RETRIES,
+    )
+    return BroadcastEngine(sender, page_size=config.BROADCAST_PAGE_SIZE, concurrency=config.BROADCAST_CONCURRENCY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Difusión masiva a los usuarios del bot")
+    sub = parser.add_subparsers(dest="accion", required=True)
+    enviar = sub.add_parser("enviar")
+    enviar.add_argument("texto")
+    enviar.add_argument("--html", action="store_true")
+    sub.add_parser("reanudar")
+    estado = sub.add_parser("estado")
+    estado.add_argument("id", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine = create_engine()
+    if args.accion == "enviar":
+        broadcast_id = engine.create(args.texto, 'HTML' if args.html else None)
+        print(engine.run(broadcast_id))
+    elif args.accion == "reanudar":
+        for estado_final in engine.resume_pending():
+            print(estado_final)
+    else:
+        print(engine.status(args.id))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# cache.py
+import threading
+from collections import OrderedDict
+
+
+class RecentIds:
+    """Ventana deslizante de los últimos `maxlen` ids vistos (memoria acotada, O(1))"""
+
+    def __init__(self, maxlen=10000):
+        self.maxlen = maxlen
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key):
+        """Registra `key`; devuelve False si ya estaba en la ventana"""
+        with self._lock:
+            if key in self._ids:
+                return False
+            self._ids[key] = None
+            if len(self._ids) > self.maxlen:
+                self._ids.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._ids.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class LRUCache:
+    """Caché LRU acotada y segura entre hilos"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key, value=None):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
@@ -1,6 +1,115 @@
 # config.py
+import json
 import os
 
-TELEGRAM_TOKEN = os.environ["TELEGRAM_TOKEN"]
-COOLDOWN_SECONDS = int(os.environ.get("COOLDOWN_SECONDS", "60"))
-ADMIN_CHAT_ID = int(os.environ["ADMIN_CHAT_ID"])
+# Ajustes de config.json (MODULES); las variables de entorno tienen prioridad
+try:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")) as f:
+        _MODULES = json.load(f).get("MODULES", {})
+except (OSError, ValueError):
+    _MODULES = {}
+
+def _flag(name):
+    value = os.environ.get(name)
+    if value is None:
+        return bool(_MODULES.get(name, False))
+    return value.lower() in ("1", "true", "yes")
+
+TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
+COOLDOWN_SECONDS = int(os.environ.get("COOLDOWN_SECONDS", "5"))
+ADMIN_CHAT_ID = int(os.environ.get("ADMIN_CHAT_ID", "8362361029"))
+
+# Cola de ingesta de Hotmart (/hotmart-webhook)
+HOTMART_QUEUE_SIZE = int(os.environ.get("HOTMART_QUEUE_SIZE", "1000"))
+HOTMART_WORKERS = int(os.environ.get("HOTMART_WORKERS", "2"))
+# "block" espera hasta HOTMART_QUEUE_TIMEOUT, "drop_new" descarta el evento
+# entrante y "drop_oldest" descarta el más antiguo de la cola.
+HOTMART_QUEUE_POLICY = os.environ.get("HOTMART_QUEUE_POLICY", "block")
+HOTMART_QUEUE_TIMEOUT = float(os.environ.get("HOTMART_QUEUE_TIMEOUT", "0.5"))
+# Outbox (outbox.py): un evento sin terminar se reintenta al vencer su lease
+HOTMART_OUTBOX_LEASE = float(os.environ.get("HOTMART_OUTBOX_LEASE", "120"))
+HOTMART_OUTBOX_SWEEP_SECONDS = float(os.environ.get("HOTMART_OUTBOX_SWEEP_SECONDS", "30"))
+# Reintentos (con backoff) de la escritura en el libro antes de dejarla al outbox
+HOTMART_LEDGER_RETRIES = int(os.environ.get("HOTMART_LEDGER_RETRIES", "3"))
+
+# Envío saliente a Telegram (sender.py)
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.environ.get("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_POOL_SIZE = int(os.environ.get("TELEGRAM_POOL_SIZE", "10"))
+TELEGRAM_MAX_RETRIES = int(os.environ.get("TELEGRAM_MAX_RETRIES", "3"))
+
+# Procesamiento de updates de Telegram (/telegram-webhook)
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", "4"))
+UPDATE_QUEUE_SIZE = int(os.environ.get("UPDATE_QUEUE_SIZE", "500"))
+UPDATE_DEDUPE_WINDOW = int(os.environ.get("UPDATE_DEDUPE_WINDOW", "10000"))
+
+# Idempotencia de webhooks de Hotmart (idempotency.py)
+HOTMART_EVENT_TTL_DAYS = int(os.environ.get("HOTMART_EVENT_TTL_DAYS", "30"))
+HOTMART_EVENT_CACHE_SIZE = int(os.environ.get("HOTMART_EVENT_CACHE_SIZE", "50000"))
+
+# Libro de ventas con commit agrupado (ledger.py); misma base que el bot
+LEDGER_DB = os.environ.get("LEDGER_DB", "data.db")
+LEDGER_BATCH_SIZE = int(os.environ.get("LEDGER_BATCH_SIZE", "100"))
+LEDGER_FLUSH_MS = int(os.environ.get("LEDGER_FLUSH_MS", "50"))
+
+# Stream SSE del dashboard (/api/ventas/stream)
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_POLL_SECONDS = float(os.environ.get("SSE_POLL_SECONDS", "1"))
+SSE_MAX_SECONDS = float(os.environ.get("SSE_MAX_SECONDS", "300"))
+# Clientes en vivo por worker; con --threads 8 quedan 5 hilos para webhooks y API.
+# Los que pasan del tope reciben 503 y el panel consulta /api/ventas cada 10 s
+SSE_MAX_CLIENTS = int(os.environ.get("SSE_MAX_CLIENTS", "3"))
+
+# Pool de conexiones SQLite (database.py)
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", "8192"))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+
+# Límite de mensajes por usuario (security.py): un token cada COOLDOWN_SECONDS,
+# ráfagas de hasta RATE_LIMIT_BURST. Por defecto en memoria (un worker, sin disco);
+# RATE_LIMIT_BACKEND=sqlite lo comparte entre varios workers de gunicorn a costa de
+# una escritura BEGIN IMMEDIATE por mensaje.
+# Por defecto 10 seguidos y luego 12 por minuto: quien explora /start, /info, /link...
+# no nota el límite y un flood sí. Al pasarse recibe un "espera N s" por ventana.
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+
+# Reparto de comisiones por niveles (affiliates/referrals.py): el primer valor es
+# para el dueño del link, los siguientes para su referente, el de éste, etc. Es un
+# reparto de la comisión cobrada, así que la suma no puede pasar de 1.0.
+REFERRAL_RATES = [float(r) for r in os.environ.get("REFERRAL_RATES", "0.85,0.10,0.05").split(",")]
+
+# Links de afiliado (affiliates/links.py): hotlink del producto en Hotmart, al que
+# se le añade ?src=neuroforge_<id>. Sin él, /link da el enlace del curso sin tracking.
+HOTMART_HOTLINK = os.environ.get("HOTMART_HOTLINK", "")
+COURSE_URL = os.environ.get("COURSE_URL", "https://bit.ly/4a8qXf8")
+
+# Difusión masiva (broadcast.py). BROADCAST_RATE es el tope de mensajes/s de una
+# difusión; dentro del bot comparte el límite global y deja el resto a las respuestas
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "20"))
+BROADCAST_PAGE_SIZE = int(os.environ.get("BROADCAST_PAGE_SIZE", "200"))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "8"))
+
+# Recordatorios automáticos (reminders.py)
+AUTO_REMINDERS = _flag("AUTO_REMINDERS")
+REMINDER_LINK_DELAY = int(os.environ.get("REMINDER_LINK_DELAY", str(24 * 3600)))
+
+# Arranque: lock que elige al único worker que revisa el webhook de Telegram
+WEBHOOK_LOCK_FILE = os.environ.get("WEBHOOK_LOCK_FILE", "/tmp/neuraforge-webhook.lock")
+
+# Embudo de conversión (analytics.py)
+ANALYTICS_BUFFER_SIZE = int(os.environ.get("ANALYTICS_BUFFER_SIZE", "10000"))
+ANALYTICS_FLUSH_SECONDS = float(os.environ.get("ANALYTICS_FLUSH_SECONDS", "5"))
+ANALYTICS_RETENTION_DAYS = int(os.environ.get("ANALYTICS_RETENTION_DAYS", "30"))
+
+# Runtime asyncio (async_bot.py)
+ASYNC_POOL_SIZE = int(os.environ.get("ASYNC_POOL_SIZE", "100"))
+ASYNC_CONCURRENCY = int(os.environ.get("ASYNC_CONCURRENCY", "1000"))
+
+# Logging (logs.py): LOG_LEVEL de config.json salvo que el entorno diga otra cosa
+LOG_LEVEL = os.environ.get("LOG_LEVEL", str(_MODULES.get("LOG_LEVEL", "INFO"))).upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.1"))
+LOG_ERROR_WINDOW = float(os.environ.get("LOG_ERROR_WINDOW", "60"))
+LOG_ERROR_BURST = int(os.environ.get("LOG_ERROR_BURST", "5"))
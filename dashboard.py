@@ -1,25 +1,27 @@
+import base64
+import csv
+import io
 import os
-import sqlite3
-from flask import Flask, render_template_string, jsonify
+import queue
+import threading
+import time
+from flask import Blueprint, Flask, Response, render_template_string, jsonify, request, stream_with_context
 from dotenv import load_dotenv
 
+import config
+from analytics import analytics
+from database import get_pool
+from ledger import aggregates, iter_sales, ledger, list_sales
+from metrics import instrument_flask
+from streams import EventHub, format_sse
+
 load_dotenv()
-app = Flask(__name__)
+# Montado en main.py bajo /dashboard; `python dashboard.py` lo sirve solo
+dashboard_bp = Blueprint('dashboard', __name__)
 
 # ✅ Base de datos ligera (funciona en Render GRATIS)
 def init_db():
-    conn = sqlite3.connect('ventas.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS ventas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            producto TEXT,
-            comision REAL,
-            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    ledger.init_db()
 
 # 📊 HTML mínimo pero funcional (carga rápido en móvil)
 DASHBOARD_HTML = '''
@@ -60,69 +62,235 @@ DASHBOARD_HTML = '''
     </div>
 
     <script>
-        // Actualiza cada 10 segundos (sin recargar página)
+        let productos = {};
+
+        // Los nombres de producto vienen de Hotmart o de imports: nunca se insertan como HTML
+        function escapar(texto) {
+            return String(texto).replace(/[&<>"']/g, c => ({
+                '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+            })[c]);
+        }
+
+        function pintar(data, completo) {
+            if (completo) productos = {};
+            for (const [producto, info] of Object.entries(data.productos)) {
+                productos[producto] = info;
+            }
+            document.getElementById('total').textContent = data.total.toFixed(2);
+
+            let html = '';
+            for (const [producto, info] of Object.entries(productos)) {
+                html += `
+                <div class="producto">
+                    <span>🔥 ${escapar(producto)}</span>
+                    <span>$${escapar(info.comision)}</span>
+                </div>
+                `;
+            }
+            document.getElementById('productos').innerHTML = html;
+        }
+
         function cargarDatos() {
-            fetch('/api/ventas')
+            fetch('{{ url_for("dashboard.api_ventas") }}')
             .then(response => response.json())
-            .then(data => {
-                document.getElementById('total').textContent = data.total.toFixed(2);
-                
-                let html = '';
-                for (const [producto, info] of Object.entries(data.productos)) {
-                    html += `
-                    <div class="producto">
-                        <span>🔥 ${producto}</span>
-                        <span>$${info.comision}</span>
-                    </div>
-                    `;
-                }
-                document.getElementById('productos').innerHTML = html;
-            });
+            .then(data => pintar(data, true));
+        }
+
+        // Las ventas llegan al instante por SSE; el navegador reconecta solo
+        // enviando Last-Event-ID. Sin EventSource, o si el servidor rechaza el
+        // stream (503: cupo de clientes lleno), consulta cada 10 segundos.
+        function consultar() {
+            setInterval(cargarDatos, 10000);
+            cargarDatos();
+        }
+
+        if (window.EventSource) {
+            const stream = new EventSource('{{ url_for("dashboard.api_ventas_stream") }}');
+            stream.addEventListener('snapshot', e => pintar(JSON.parse(e.data), true));
+            stream.addEventListener('delta', e => pintar(JSON.parse(e.data), false));
+            stream.onerror = () => {
+                if (stream.readyState === EventSource.CLOSED) consultar();
+            };
+        } else {
+            consultar();
         }
-        setInterval(cargarDatos, 10000);
-        cargarDatos();
     </script>
 </body>
 </html>
 '''
 
+def resumen(version, total, productos):
+    return {
+        "version": version,
+        "total": total,
+        "productos": {producto: {"comision": comision} for producto, comision in productos.items()}
+    }
+
 # 📈 Rutas del dashboard
-@app.route('/')
+@dashboard_bp.route('/')
 def dashboard():
     return render_template_string(DASHBOARD_HTML)
 
-@app.route('/api/ventas')
+@dashboard_bp.route('/api/ventas')
 def api_ventas():
-    conn = sqlite3.connect('ventas.db')
-    c = conn.cursor()
-    c.execute('SELECT producto, SUM(comision) as total FROM ventas GROUP BY producto')
-    rows = c.fetchall()    
-    total = sum(row[1] for row in rows)
-    productos = {}
-    for row in rows:
-        productos[row[0]] = {"comision": row[1]}
-    
-    conn.close()
+    # Foto en memoria de los acumulados: O(1) por consulta y 304 si nada cambió
+    version, total, productos = aggregates.snapshot()
+    etag = f'"v{version}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag}
+
+    response = jsonify(resumen(version, total, productos))
+    response.headers['ETag'] = etag
+    return response
+
+# 📜 Ventas una a una: paginación por (fecha, id) y export CSV en streaming
+LISTADO_MAX = 1000
+
+def cursor_de(fecha, venta_id):
+    return base64.urlsafe_b64encode(f"{fecha}|{venta_id}".encode()).decode()
+
+def leer_cursor(cursor):
+    fecha, venta_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return fecha, int(venta_id)
+
+@dashboard_bp.route('/api/ventas/list')
+def api_ventas_list():
+    limite = min(max(request.args.get('limit', 100, type=int), 1), LISTADO_MAX)
+    despues = None
+    if request.args.get('cursor'):
+        try:
+            despues = leer_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({"error": "cursor inválido"}), 400
+
+    conn = get_pool(config.LEDGER_DB).connection()
+    filas = list_sales(conn, despues, limite, request.args.get('desde'), request.args.get('hasta'))
+    siguiente = cursor_de(filas[-1][1], filas[-1][0]) if len(filas) == limite else None
     return jsonify({
-        "total": total,
-        "productos": productos
+        "ventas": [
+            {"id": venta_id, "fecha": fecha, "producto": producto, "comision": comision}
+            for venta_id, fecha, producto, comision in filas
+        ],
+        "siguiente": siguiente,
     })
 
-# 🔐 Ruta para registrar ventas (usada por main.py)
-@app.route('/registrar-venta', methods=['POST'])
-def registrar_venta():
-    producto = request.json.get('producto')
-    comision = float(request.json.get('comision', 0))
-    
-    conn = sqlite3.connect('ventas.db')
-    c = conn.cursor()
-    c.execute('INSERT INTO ventas (producto, comision) VALUES (?, ?)', (producto, comision))
-    conn.commit()
-    conn.close()
-    
-    return jsonify({"status": "success"}), 200
+@dashboard_bp.route('/api/ventas/export.csv')
+def api_ventas_export():
+    conn = get_pool(config.LEDGER_DB).connection()
+    lotes = iter_sales(conn, request.args.get('desde'), request.args.get('hasta'))
 
-if __name__ == "__main__":
+    def filas():
+        # Memoria constante: cada lote del cursor se escribe y se envía antes de leer el siguiente
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(("id", "fecha", "producto", "comision"))
+        yield buffer.getvalue()
+        try:
+            for lote in lotes:
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(lote)
+                yield buffer.getvalue()
+        finally:
+            lotes.close()
+
+    return Response(filas(), mimetype='text/csv', headers={
+        'Content-Disposition': 'attachment; filename="ventas.csv"',
+        'X-Accel-Buffering': 'no',
+    })
+
+# 🧭 Embudo /start -> /link -> /info -> compra (lee solo los acumulados de analytics.py)
+@dashboard_bp.route('/api/embudo')
+def api_embudo():
+    dias = request.args.get('dias', 7, type=int)
+    return jsonify(analytics.funnel(time.time() - dias * 86400))
+
+# 📡 Stream de ventas en vivo (un único publicador para todos los clientes)
+# Tope de clientes SSE por proceso: cada uno retiene un hilo de gunicorn hasta
+# SSE_MAX_SECONDS y los webhooks de Telegram y Hotmart necesitan los suyos
+ventas_hub = EventHub(max_subscribers=config.SSE_MAX_CLIENTS)
+_vigilante = None
+_vigilante_lock = threading.Lock()
+
+def publicar_cambios(version, total, cambios):
+    if cambios is None:
+        ventas_hub.publish("snapshot", resumen(version, total, aggregates.productos), version)
+    else:
+        ventas_hub.publish("delta", resumen(version, total, cambios), version)
+
+aggregates.subscribe(publicar_cambios)
+
+def vigilar_ventas():
+    # Detecta ventas escritas por otro proceso: un PRAGMA por segundo para todos los clientes
+    while True:
+        if len(ventas_hub):
+            aggregates.snapshot()
+        time.sleep(config.SSE_POLL_SECONDS)
+
+def iniciar_vigilante():
+    global _vigilante
+    with _vigilante_lock:
+        if _vigilante is None:
+            _vigilante = threading.Thread(target=vigilar_ventas, name="ventas-sse", daemon=True)
+            _vigilante.start()
+
+@dashboard_bp.route('/api/ventas/stream')
+def api_ventas_stream():
+    iniciar_vigilante()
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    # Primero la suscripción y después la foto: un delta publicado entre ambas
+    # llega por la cola, y lo que la foto ya incluye (id <= su versión) se descarta
+    sub, pendientes = ventas_hub.subscribe(last_event_id)
+    if sub is None:
+        # Cupo lleno: el navegador cierra el EventSource y el panel pasa a consultar /api/ventas
+        return Response('demasiados clientes en vivo', status=503, headers={'Retry-After': '30'})
+    if pendientes is None:
+        try:
+            version, total, productos = aggregates.snapshot()
+        except Exception:
+            ventas_hub.unsubscribe(sub)
+            raise
+    else:
+        version = last_event_id
+
+    def eventos():
+        try:
+            yield b"retry: 3000\n\n"
+            if pendientes is None:
+                yield format_sse("snapshot", resumen(version, total, productos), version)
+            else:
+                yield from pendientes
+            # Cortamos cada SSE_MAX_SECONDS para no retener un worker indefinidamente;
+            # el navegador reconecta con Last-Event-ID y no pierde nada
+            fin = time.monotonic() + config.SSE_MAX_SECONDS
+            while not sub.dropped and time.monotonic() < fin:
+                try:
+                    event_id, message = sub.queue.get(timeout=config.SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield b": ping\n\n"
+                    continue
+                if event_id is not None and event_id <= version:
+                    continue
+                yield message
+        finally:
+            ventas_hub.unsubscribe(sub)
+
+    return Response(stream_with_context(eventos()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+def create_app():
+    """Dashboard como app independiente (desarrollo o despliegue separado)"""
+    app = Flask(__name__)
+    app.register_blueprint(dashboard_bp)
+    instrument_flask(app)
     init_db()
+    return app
+
+if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10001))  # Puerto diferente al bot
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
@@ -1,20 +1,146 @@
 # database.py
-import sqlite3
 import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+from metrics import DB_LATENCY
+
+DEFAULT_DB = 'data.db'
+
+
+class ConnectionPool:
+    """Una conexión SQLite por hilo (y por proceso) con WAL y pragmas afinados.
 
-def init_db():
-    conn = sqlite3.connect('data.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS affiliates (
-            user_id INTEGER PRIMARY KEY,
-            referral_code TEXT UNIQUE,
-            referred_by INTEGER,
-            balance REAL DEFAULT 0.0
+    Reutilizar la conexión evita pagar `connect` en cada consulta y conserva
+    la caché de sentencias preparadas (`cached_statements`), así que repetir
+    el mismo SQL no lo vuelve a compilar.
+    """
+
+    def __init__(self, path, timeout=5.0, cache_size_kb=8192, mmap_size=64 * 1024 * 1024,
+                 cached_statements=256):
+        self.path = path
+        self.timeout = timeout
+        self._latency = DB_LATENCY.labels(os.path.basename(path))
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
         )
-    ''')
-    conn.commit()
-    conn.close()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def connection(self):
+        """Conexión del hilo actual (no cerrarla: la reutiliza el siguiente uso)"""
+        if os.getpid() != self._pid:
+            # Tras un fork (gunicorn --preload) no se heredan conexiones del padre
+            self._local = threading.local()
+            self._all = []
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """`with pool.transaction() as conn:` hace commit al salir o rollback si hay error"""
+        conn = self.connection()
+        start = time.perf_counter()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._latency.observe(time.perf_counter() - start)
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._all = []
+        self._local = threading.local()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=DEFAULT_DB):
+    """Pool compartido por ruta: todos los módulos de un proceso usan el mismo"""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = ConnectionPool(
+                    path,
+                    cache_size_kb=config.DB_CACHE_SIZE_KB,
+                    mmap_size=config.DB_MMAP_SIZE,
+                )
+                _pools[path] = pool
+    return pool
+
+
+def init_db(path=DEFAULT_DB):
+    with get_pool(path).transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                telegram_id INTEGER UNIQUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS links (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                telegram_id INTEGER,
+                platform TEXT,
+                url TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS affiliates (
+                user_id INTEGER PRIMARY KEY,
+                referral_code TEXT UNIQUE,
+                referred_by INTEGER,
+                balance REAL DEFAULT 0.0
+            )
+        ''')
+
+
+def register_user(telegram_id):
+    """Alta idempotente en `users`; devuelve True si el usuario es nuevo"""
+    with get_pool().transaction() as conn:
+        cur = conn.execute('INSERT OR IGNORE INTO users (telegram_id) VALUES (?)', (telegram_id,))
+    return cur.rowcount == 1
+
 
 def get_connection():
-    return sqlite3.connect('data.db')
+    return get_pool().connection()
@@ -14,7 +14,6 @@ if [ ! -f "requirements.txt" ]; then
     echo "📦 Creando requirements.txt..."
     cat > requirements.txt << EOL
 Flask==2.3.3
-pyTelegramBotAPI==4.18.0
 requests==2.31.0
 schedule==1.2.0
 gitpython==3.1.37
@@ -36,7 +35,6 @@ import subprocess
 
 libs = [
     ("flask", "Flask"),
-    ("telebot", "pyTelegramBotAPI"),
     ("requests", "requests"),
     ("schedule", "schedule"),
     ("git", "gitpython"),
@@ -0,0 +1,111 @@
+# idempotency.py
+import logging
+import threading
+import time
+
+from cache import LRUCache
+from database import DEFAULT_DB, get_pool
+
+logger = logging.getLogger(__name__)
+
+
+def event_key(data):
+    """Clave idempotente de un webhook de Hotmart: evento + transacción (o id del evento)"""
+    purchase = (data.get('data') or {}).get('purchase') or {}
+    ref = purchase.get('transaction') or data.get('id')
+    if not ref:
+        return None
+    return f"{data.get('event')}:{ref}"
+
+
+class IdempotencyStore:
+    """Registro persistente de eventos ya procesados, con LRU en memoria delante.
+
+    La tabla es la que decide: los duplicados recientes se resuelven en la LRU
+    sin tocar disco y un fallo de la LRU (reinicio, otro worker, clave
+    expulsada) se consulta en SQLite. Las claves caducan a los `ttl_seconds`.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, ttl_seconds=30 * 86400, cache_size=50000,
+                 compact_every=1000, compact_batch=500):
+        self.db_path = db_path
+        self.ttl = ttl_seconds
+        self.compact_every = compact_every
+        self.compact_batch = compact_batch
+        self._cache = LRUCache(cache_size)
+        self._pool = get_pool(db_path)
+        self._ready = False
+        self._lock = threading.Lock()
+        self._inserts = 0
+
+    def init_db(self):
+        with self._pool.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS hotmart_events (
+                    event_key TEXT PRIMARY KEY,
+                    received_at REAL,
+                    expires_at REAL
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_hotmart_events_expires ON hotmart_events (expires_at)')
+        self._ready = True
+
+    def _transaction(self):
+        if not self._ready:
+            self.init_db()
+        return self._pool.transaction()
+
+    def seen(self, key):
+        """True si `key` ya se procesó: LRU primero, SQLite si no está en memoria"""
+        if key in self._cache:
+            return True
+        if not self._ready:
+            self.init_db()
+        row = self._pool.connection().execute(
+            'SELECT 1 FROM hotmart_events WHERE event_key = ? AND expires_at >= ?', (key, time.time())
+        ).fetchone()
+        if row is None:
+            return False
+        self._cache.put(key)
+        return True
+
+    def claim(self, key):
+        """Marca `key` como procesado; devuelve False si ya lo estaba"""
+        if key in self._cache:
+            return False
+        now = time.time()
+        with self._transaction() as conn:
+            # Una clave caducada aún sin compactar se reclama de nuevo
+            cur = conn.execute('''
+                INSERT INTO hotmart_events (event_key, received_at, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (event_key) DO UPDATE SET
+                    received_at = excluded.received_at, expires_at = excluded.expires_at
+                WHERE hotmart_events.expires_at < excluded.received_at
+            ''', (key, now, now + self.ttl))
+        self._cache.put(key)
+        if cur.rowcount == 0:
+            return False
+        with self._lock:
+            self._inserts += 1
+            compact = self._inserts % self.compact_every == 0
+        if compact:
+            self.compact(now)
+        return True
+
+    def compact(self, now=None):
+        """Borra claves expiradas en lotes pequeños para no bloquear a los escritores"""
+        now = now or time.time()
+        removed = 0
+        while True:
+            with self._transaction() as conn:
+                cur = conn.execute('''
+                    DELETE FROM hotmart_events WHERE event_key IN (
+                        SELECT event_key FROM hotmart_events WHERE expires_at < ? LIMIT ?
+                    )
+                ''', (now, self.compact_batch))
+            removed += cur.rowcount
+            if cur.rowcount < self.compact_batch:
+                break
+        if removed:
+            logger.info("🧹 %s eventos de Hotmart expirados compactados.", removed)
+        return removed
@@ -0,0 +1,408 @@
+# ledger.py
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import config
+from database import DEFAULT_DB, get_pool
+from metrics import DB_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    __slots__ = ("row", "done", "error", "inserted")
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.error = None
+        self.inserted = False
+
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS ventas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto TEXT,
+        comision REAL,
+        fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        clave TEXT
+    );
+    CREATE TABLE IF NOT EXISTS ventas_por_producto (
+        producto TEXT PRIMARY KEY,
+        ventas INTEGER NOT NULL DEFAULT 0,
+        comision REAL NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS ventas_por_dia (
+        dia TEXT PRIMARY KEY,
+        ventas INTEGER NOT NULL DEFAULT 0,
+        comision REAL NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS ventas_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    -- Cubre el listado y el export: recorre (fecha, id) sin tocar la tabla
+    CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas (fecha, id, producto, comision);
+'''
+
+UPSERT_PRODUCTO = '''
+    INSERT INTO ventas_por_producto (producto, ventas, comision) VALUES (?, ?, ?)
+    ON CONFLICT(producto) DO UPDATE SET
+        ventas = ventas + excluded.ventas,
+        comision = comision + excluded.comision
+'''
+
+UPSERT_DIA = '''
+    INSERT INTO ventas_por_dia (dia, ventas, comision) VALUES (?, ?, ?)
+    ON CONFLICT(dia) DO UPDATE SET
+        ventas = ventas + excluded.ventas,
+        comision = comision + excluded.comision
+'''
+
+
+# Base propia que usaba el dashboard cuando corría como proceso aparte
+LEGACY_DB = 'ventas.db'
+
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(ventas)')}
+    if 'clave' in columns and conn.execute('SELECT 1 FROM ventas_meta').fetchone() is not None:
+        return
+    # ATTACH no se permite dentro de una transacción: la base vieja se adjunta antes
+    legacy = _attach_legacy(conn)
+    try:
+        with conn:
+            # IMMEDIATE y volver a mirar dentro: si varios workers arrancan a la vez,
+            # uno solo migra, importa la base vieja y crea la fila de versión
+            conn.execute('BEGIN IMMEDIATE')
+            # `clave` (idempotente, ver idempotency.event_key) llegó después: se añade a tablas viejas
+            if 'clave' not in {row[1] for row in conn.execute('PRAGMA table_info(ventas)')}:
+                conn.execute('ALTER TABLE ventas ADD COLUMN clave TEXT')
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_ventas_clave ON ventas (clave)')
+            if conn.execute('SELECT 1 FROM ventas_meta').fetchone() is None:
+                if legacy:
+                    _import_legacy(conn)
+                # Primera vez con acumulados: se calculan una sola vez desde el histórico
+                conn.execute('INSERT INTO ventas_meta (id, version) VALUES (1, 0)')
+                _rebuild_rollups(conn)
+    finally:
+        if legacy:
+            conn.execute('DETACH DATABASE legacy')
+
+
+def _attach_legacy(conn, legacy_path=LEGACY_DB):
+    """Adjunta la antigua ventas.db como `legacy` si existe y el libro vive ahora en otra base"""
+    main_path = next(row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main')
+    if not os.path.exists(legacy_path) or not main_path or os.path.samefile(main_path, legacy_path):
+        return False
+    conn.execute('ATTACH DATABASE ? AS legacy', (legacy_path,))
+    if conn.execute("SELECT 1 FROM legacy.sqlite_master WHERE name = 'ventas'").fetchone() is None:
+        conn.execute('DETACH DATABASE legacy')
+        return False
+    return True
+
+
+def _import_legacy(conn):
+    """Copia las ventas de la base adjunta `legacy` (dentro de la transacción de quien llama)"""
+    cur = conn.execute(
+        'INSERT INTO ventas (producto, comision, fecha) '
+        'SELECT producto, comision, fecha FROM legacy.ventas ORDER BY id'
+    )
+    logger.info("📦 %s ventas importadas desde %s", cur.rowcount, LEGACY_DB)
+
+
+def rebuild_rollups(conn):
+    """Recalcula los acumulados desde `ventas` (migración o importación masiva)"""
+    with conn:
+        _rebuild_rollups(conn)
+
+
+def _rebuild_rollups(conn):
+    conn.execute('DELETE FROM ventas_por_producto')
+    conn.execute('DELETE FROM ventas_por_dia')
+    conn.execute('''
+        INSERT INTO ventas_por_producto (producto, ventas, comision)
+        SELECT producto, COUNT(*), SUM(comision) FROM ventas GROUP BY producto
+    ''')
+    conn.execute('''
+        INSERT INTO ventas_por_dia (dia, ventas, comision)
+        SELECT date(fecha), COUNT(*), SUM(comision) FROM ventas GROUP BY date(fecha)
+    ''')
+    conn.execute('UPDATE ventas_meta SET version = version + 1 WHERE id = 1')
+
+
+def _range(desde=None, hasta=None):
+    """Filtro opcional por fecha: desde <= fecha < hasta"""
+    where, params = [], []
+    if desde:
+        where.append('fecha >= ?')
+        params.append(desde)
+    if hasta:
+        where.append('fecha < ?')
+        params.append(hasta)
+    return where, params
+
+
+def list_sales(conn, after=None, limit=100, desde=None, hasta=None):
+    """Una página de ventas, de la más reciente a la más antigua.
+
+    Paginación por clave: `after` es el (fecha, id) de la última fila de la
+    página anterior y la consulta salta directo a ese punto del índice, así
+    que la página mil cuesta lo mismo que la primera (OFFSET recorrería y
+    descartaría todas las filas anteriores).
+    """
+    where, params = _range(desde, hasta)
+    if after is not None:
+        where.append('(fecha, id) < (?, ?)')
+        params.extend(after)
+    sql = 'SELECT id, fecha, producto, comision FROM ventas'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY fecha DESC, id DESC LIMIT ?'
+    return conn.execute(sql, (*params, limit)).fetchall()
+
+
+def iter_sales(conn, desde=None, hasta=None, chunk_size=1000):
+    """Todas las ventas en orden cronológico, leídas del cursor de a `chunk_size`"""
+    where, params = _range(desde, hasta)
+    sql = 'SELECT id, fecha, producto, comision FROM ventas'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    cursor = conn.execute(sql + ' ORDER BY fecha, id', params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        # Si el cliente corta la descarga se libera la lectura en curso
+        cursor.close()
+
+
+def _rollup(rows):
+    """Agrupa un lote de filas (producto, comision, fecha[, clave]) por producto y por día"""
+    productos, dias = {}, {}
+    for producto, comision, fecha, *_ in rows:
+        n, total = productos.get(producto, (0, 0.0))
+        productos[producto] = (n + 1, total + comision)
+        dia = fecha[:10]
+        n, total = dias.get(dia, (0, 0.0))
+        dias[dia] = (n + 1, total + comision)
+    return productos, dias
+
+
+class SalesAggregates:
+    """Foto en memoria de las comisiones por producto, con número de versión.
+
+    La versión vive en `ventas_meta` y sube en cada commit del libro, así que
+    es la misma para todos los procesos. Consultar la foto cuesta un
+    `PRAGMA data_version` (sin E/S si nadie escribió) y solo se recargan las
+    tablas de acumulados (una fila por producto) cuando la versión cambia.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB):
+        self.db_path = db_path
+        self.version = None
+        self.total = 0.0
+        self.productos = {}
+        self._pool = get_pool(db_path)
+        self._ready = False
+        self._seen = threading.local()
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """`callback(version, total, cambios)` tras cada cambio; cambios=None si se recargó todo"""
+        self._listeners.append(callback)
+
+    def _notify(self, changed):
+        for callback in self._listeners:
+            try:
+                callback(self.version, self.total, changed)
+            except Exception as e:
+                logger.error("❌ Error notificando acumulados: %s", e)
+
+    def apply(self, version, productos):
+        """Aplica el delta de un lote recién confirmado por el escritor de este proceso"""
+        with self._lock:
+            if self.version is None or version != self.version + 1:
+                return
+            changed = {}
+            for producto, (_, comision) in productos.items():
+                changed[producto] = self.productos.get(producto, 0.0) + comision
+                self.total += comision
+            self.productos.update(changed)
+            self.version = version
+            self._notify(changed)
+
+    def snapshot(self):
+        """Devuelve (version, total, productos) al día con lo confirmado en disco"""
+        conn = self._pool.connection()
+        if not self._ready:
+            ensure_schema(conn)
+            self._ready = True
+        # data_version es por conexión: cada hilo recuerda el último que vio
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != getattr(self._seen, 'data_version', None) or self.version is None:
+            self._seen.data_version = data_version
+            version = conn.execute('SELECT version FROM ventas_meta WHERE id = 1').fetchone()[0]
+            with self._lock:
+                if self.version is None or version > self.version:
+                    self._reload(conn, version)
+        with self._lock:
+            return self.version, self.total, dict(self.productos)
+
+    def _reload(self, conn, version):
+        rows = conn.execute('SELECT producto, comision FROM ventas_por_producto').fetchall()
+        self.productos = {producto: comision for producto, comision in rows}
+        self.total = sum(self.productos.values())
+        self.version = version
+        self._notify(None)
+
+
+class LedgerWriter:
+    """Escritor único del libro de ventas con commit agrupado.
+
+    Las ventas se acumulan en memoria y se escriben con un solo `executemany`
+    por transacción cada `batch_size` filas o `flush_ms` milisegundos. Quien
+    llama a `record` no recibe respuesta hasta que su fila está en disco, así
+    que una ráfaga de ventas cuesta un fsync en lugar de cientos.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, batch_size=100, flush_ms=50, aggregates=None):
+        self.db_path = db_path
+        self.aggregates = aggregates
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.flushes = 0
+        self.rows = 0
+
+    def init_db(self):
+        ensure_schema(get_pool(self.db_path).connection())
+
+    def _connect(self):
+        # Conexión del hilo escritor. FULL (en vez del NORMAL del pool): cada
+        # commit es durable y el coste del fsync se reparte entre todo el lote
+        conn = get_pool(self.db_path).connection()
+        conn.execute('PRAGMA synchronous=FULL')
+        ensure_schema(conn)
+        return conn
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def record(self, producto, comision, timeout=30, key=None):
+        """Registra una venta y espera a que el lote que la contiene haga commit.
+
+        Devuelve False si `key` ya estaba en el libro (p. ej. venta importada).
+        """
+        if self._thread is None:
+            self.start()
+        fecha = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        pending = _Pending((producto, float(comision), fecha, key))
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("El libro de ventas no confirmó la escritura a tiempo")
+        if pending.error:
+            raise pending.error
+        return pending.inserted
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Vacía lo pendiente y detiene el hilo escritor"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(conn, batch)
+
+    def _fresh(self, conn, batch):
+        """Descarta del lote las claves que ya están en el libro (o repetidas en el lote)"""
+        keys = [p.row[3] for p in batch if p.row[3]]
+        seen = set()
+        if keys:
+            marks = ','.join('?' * len(keys))
+            seen = {row[0] for row in conn.execute(f'SELECT clave FROM ventas WHERE clave IN ({marks})', keys)}
+        fresh = []
+        for pending in batch:
+            key = pending.row[3]
+            if key:
+                if key in seen:
+                    continue
+                seen.add(key)
+            fresh.append(pending)
+        return fresh
+
+    def _flush(self, conn, batch):
+        error = None
+        start = time.perf_counter()
+        try:
+            with conn:
+                fresh = self._fresh(conn, batch)
+                rows = [p.row for p in fresh]
+                productos, dias = _rollup(rows)
+                conn.executemany('INSERT INTO ventas (producto, comision, fecha, clave) VALUES (?, ?, ?, ?)', rows)
+                conn.executemany(UPSERT_PRODUCTO, [(k, n, c) for k, (n, c) in productos.items()])
+                conn.executemany(UPSERT_DIA, [(k, n, c) for k, (n, c) in dias.items()])
+                conn.execute('UPDATE ventas_meta SET version = version + 1 WHERE id = 1')
+                version = conn.execute('SELECT version FROM ventas_meta WHERE id = 1').fetchone()[0]
+            DB_LATENCY.labels('ledger_flush').observe(time.perf_counter() - start)
+            if self.aggregates is not None:
+                self.aggregates.apply(version, productos)
+            for pending in fresh:
+                pending.inserted = True
+            self.flushes += 1
+            self.rows += len(rows)
+        except sqlite3.Error as e:
+            logger.error("❌ Error escribiendo lote de %s ventas: %s", len(batch), e)
+            error = e
+        for pending in batch:
+            pending.error = error
+            pending.done.set()
+
+
+# Instancias compartidas por main.py y el blueprint del dashboard
+aggregates = SalesAggregates(config.LEDGER_DB)
+ledger = LedgerWriter(
+    config.LEDGER_DB,
+    batch_size=config.LEDGER_BATCH_SIZE,
+    flush_ms=config.LEDGER_FLUSH_MS,
+    aggregates=aggregates,
+)
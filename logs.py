@@ -0,0 +1,144 @@
+# logs.py
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+import config
+
+# Atributos propios de LogRecord: todo lo demás llegó por `extra` y va como campo del JSON
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# extra=SAMPLE en eventos de mucho volumen: solo se registra una fracción
+SAMPLE = {"sample": config.LOG_SAMPLE_RATE}
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro: ts, level, logger, msg y los campos de `extra`"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar una fracción `record.sample` de los registros que la traen"""
+
+    def filter(self, record):
+        rate = getattr(record, "sample", None)
+        return rate is None or rate >= 1 or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """Como mucho `burst` repeticiones del mismo aviso/error por ventana.
+
+    La clave es la plantilla sin formatear (logger, nivel, msg), así que el
+    mismo error con distintos argumentos cuenta como repetido. El primer
+    registro que pasa tras una ventana con descartes lleva `suppressed=N`.
+    """
+
+    def __init__(self, window=60.0, burst=5, level=logging.WARNING, max_keys=1000):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.level = level
+        self.max_keys = max_keys
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            start, count, suppressed = self._seen.get(key, (now, 0, 0))
+            if now - start >= self.window:
+                start, count = now, 0
+            if count >= self.burst:
+                self._seen[key] = (start, count, suppressed + 1)
+                return False
+            if suppressed and count == 0:
+                record.suppressed = suppressed
+                suppressed = 0
+            if len(self._seen) >= self.max_keys and key not in self._seen:
+                self._seen.clear()
+            self._seen[key] = (start, count + 1, suppressed)
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Encola el registro tal cual: el formateo (msg % args, JSON) ocurre en el listener.
+
+    Si la cola está llena el registro se descarta en lugar de bloquear la petición.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_lock = threading.Lock()
+
+
+def setup_logging(level=None, fmt=None, stream=None):
+    """Configura el logging del proceso (una vez): cola + hilo escritor + filtros"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        output = logging.StreamHandler(stream or sys.stdout)
+        if (fmt or config.LOG_FORMAT) == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+        handler = NonBlockingQueueHandler(queue.Queue(config.LOG_QUEUE_SIZE))
+        handler.addFilter(SamplingFilter())
+        handler.addFilter(RateLimitFilter(config.LOG_ERROR_WINDOW, config.LOG_ERROR_BURST))
+
+        root = logging.getLogger()
+        for old in list(root.handlers):
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(level or config.LOG_LEVEL)
+
+        _listener = QueueListener(handler.queue, output)
+        _listener.start()
+        # Al salir se vacía la cola para no perder los últimos registros
+        atexit.register(stop_logging)
+        return _listener
+
+
+def stop_logging():
+    """Vacía la cola y detiene el hilo escritor (se puede llamar más de una vez)"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -2,15 +2,42 @@
 import os
 import sys
 import json
+import math
+import time
+import random
+import atexit
+import sqlite3
+import fcntl
 import logging
+import threading
 from flask import Flask, request, jsonify
-import telebot
+
+import config
+import database
+from analytics import analytics
+from affiliates.hotmart import parse_src, purchase_src
+from affiliates.links import LinkService
+from affiliates.referrals import ReferralEngine, parse_referral
+from broadcast import BroadcastEngine
+from cache import RecentIds
+from dashboard import dashboard_bp
+from idempotency import IdempotencyStore, event_key
+from ledger import aggregates, ledger
+from logs import SAMPLE, setup_logging
+from metrics import instrument_flask, registry
+from outbox import Outbox
+from reminders import ReminderScheduler
+from router import CommandRouter, prepare
+from security import MemoryLimiter, create_limiter
+from sender import SendError, TelegramSender
+from workers import KeyedWorkerPool, WorkerPool
+
+# Referencia para medir el arranque en frío (import + create_app)
+BOOT_STARTED = time.perf_counter()
 
 # 1. CONFIGURACIÓN DE LOGS PARA RENDER
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# JSON por línea escrito desde un hilo aparte; nivel según LOG_LEVEL de config.json
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # 2. CONFIGURACIÓN DE IDENTIDAD
@@ -22,104 +49,388 @@ if not TELEGRAM_TOKEN:
     logger.error("❌ ERROR: TELEGRAM_TOKEN no configurado en Environment de Render")
     sys.exit(1)
 
-# Inicializar bot y servidor
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
+# Inicializar servidor
 app = Flask(__name__)
 
+# Todo mensaje saliente pasa por el sender (pool keep-alive + límites de Telegram)
+sender = TelegramSender(
+    TELEGRAM_TOKEN,
+    api_url=config.TELEGRAM_API_URL,
+    global_rate=config.TELEGRAM_GLOBAL_RATE,
+    chat_rate=config.TELEGRAM_CHAT_RATE,
+    pool_size=config.TELEGRAM_POOL_SIZE,
+    max_retries=config.TELEGRAM_MAX_RETRIES,
+)
+
 # 3. HANDLERS DE COMANDOS (Atención al Cliente)
-@bot.message_handler(commands=['start', 'help'])
-def send_welcome(message):
-    welcome_text = (
-        "<b>¡BIENVENIDO A NEURAFORGEA!</b> 🎉\n"
-        "<i>Especialistas en el CURSO DE RESINA EPÓXICA</i>\n\n"
-        "<b>Beneficios del Curso:</b>\n"
-        "• Aprende desde cero técnicas profesionales.\n"
-        "• Certificación al finalizar.\n"
-        "• Acceso de por vida.\n\n"
-        "🔗 <b>Enlace de Acceso:</b> <a href='https://bit.ly/4a8qXf8'>Haz clic aquí para ver el curso</a>\n\n"
-        "Usa /info para ver detalles o /link para tu enlace de afiliado."
-    )
-    bot.reply_to(message, welcome_text, parse_mode='HTML')
-    logger.info(f"✅ /start enviado a {message.chat.id}")
-
-@bot.message_handler(commands=['link'])
-def send_link(message):
-    link_text = (
-        "🔗 <b>TU LINK DE AFILIADO LISTO:</b>\n\n"
-        "<code>https://bit.ly/4a8qXf8</code>\n\n"
-        "Recuerda que ganas <b>$48.5 USD</b> por cada venta realizada a través de este enlace."
-    )
-    bot.reply_to(message, link_text, parse_mode='HTML')
-
-@bot.message_handler(commands=['info', 'curso'])
-def send_info(message):
-    info_text = (
-        "⚠️ ¡ATENCIÓN: PROMOCIÓN POR TIEMPO LIMITADO! ⚠️\n\n"
-        "El productor ha activado un contador regresivo. Una vez que llegue a cero, "
-        "el bono de descuento y los regalos desaparecerán para siempre. ⏳\n\n"
-        "🎨 CURSO DE RESINA EPÓXICA\n"
-        "• Acceso inmediato a los 15 módulos.\n"
-        "• Certificado oficial incluido.\n\n"
-        "💰 PRECIO ESPECIAL: Solo por las próximas horas.\n"
-        "🔗 VER CUENTA REGRESIVA AQUÍ:\n"
-        "https://bit.ly/4a8qXf8"
-    )
-    bot.reply_to(message, info_text, parse_mode='HTML')
+# Router en O(1) sobre el update crudo; las respuestas fijas se arman una sola vez aquí
+router = CommandRouter(sender, tracker=analytics.track)
+referrals = ReferralEngine(config.REFERRAL_RATES)
 
-@bot.message_handler(func=lambda message: True)
-def echo_all(message):
-    # Respuesta por defecto para guiar al usuario
-    bot.reply_to(message, "🤖 Usa los comandos del menú o escribe /start para ver las opciones.")
+WELCOME_REPLY = prepare(
+    "<b>¡BIENVENIDO A NEURAFORGEA!</b> 🎉\n"
+    "<i>Especialistas en el CURSO DE RESINA EPÓXICA</i>\n\n"
+    "<b>Beneficios del Curso:</b>\n"
+    "• Aprende desde cero técnicas profesionales.\n"
+    "• Certificación al finalizar.\n"
+    "• Acceso de por vida.\n\n"
+    "🔗 <b>Enlace de Acceso:</b> <a href='https://bit.ly/4a8qXf8'>Haz clic aquí para ver el curso</a>\n\n"
+    "Usa /info para ver detalles o /link para tu enlace de afiliado.",
+    parse_mode='HTML',
+)
+
+@router.command('start', 'help')
+def send_welcome(message, args):
+    # Alta del usuario; "/start ref123" viene del link de invitación de otro afiliado
+    user_id = message['from']['id']
+    database.register_user(user_id)
+    referrals.join(user_id, parse_referral(args) if args else None)
+    logger.info("✅ /start de %s", message['chat']['id'], extra=SAMPLE)
+    return WELCOME_REPLY
+
+links = LinkService()
+
+# Seguimiento automático: si pidió /link y no hubo venta, se le recuerda pasado un tiempo
+reminders = ReminderScheduler(lambda chat_id, text: sender.send_message(chat_id, text, parse_mode='HTML'))
+LINK_FOLLOWUP_TEXT = (
+    "⏳ <b>¿Sigues interesado en el CURSO DE RESINA EPÓXICA?</b>\n\n"
+    "La promoción está por terminar. Usa /link para volver a ver tu enlace "
+    "o /info para ver los detalles."
+)
+LINK_TEXT = (
+    "🔗 <b>TU LINK DE AFILIADO LISTO:</b>\n\n"
+    "<code>{link}</code>\n\n"
+    "Recuerda que ganas <b>$48.5 USD</b> por cada venta realizada a través de este enlace."
+)
+
+@router.command('link')
+def send_link(message, args):
+    user_id = message['from']['id']
+    link = links.get_or_create(user_id)
+    if config.AUTO_REMINDERS:
+        reminders.cancel(user_id, 'link_followup')
+        reminders.schedule(user_id, LINK_FOLLOWUP_TEXT, delay=config.REMINDER_LINK_DELAY, kind='link_followup')
+    return prepare(LINK_TEXT.format(link=link), parse_mode='HTML')
+
+router.static('info', 'curso', payload=prepare(
+    "⚠️ ¡ATENCIÓN: PROMOCIÓN POR TIEMPO LIMITADO! ⚠️\n\n"
+    "El productor ha activado un contador regresivo. Una vez que llegue a cero, "
+    "el bono de descuento y los regalos desaparecerán para siempre. ⏳\n\n"
+    "🎨 CURSO DE RESINA EPÓXICA\n"
+    "• Acceso inmediato a los 15 módulos.\n"
+    "• Certificado oficial incluido.\n\n"
+    "💰 PRECIO ESPECIAL: Solo por las próximas horas.\n"
+    "🔗 VER CUENTA REGRESIVA AQUÍ:\n"
+    "https://bit.ly/4a8qXf8",
+    parse_mode='HTML',
+))
+
+broadcasts = BroadcastEngine(
+    sender,
+    page_size=config.BROADCAST_PAGE_SIZE,
+    concurrency=config.BROADCAST_CONCURRENCY,
+    rate=config.BROADCAST_RATE,
+)
+
+BROADCAST_USAGE = prepare("Uso: /difundir <texto>")
+
+@router.command('difundir', allow=lambda message: str(message['from']['id']) == ADMIN_ID)
+def send_broadcast(message, args):
+    """Solo admin: /difundir <texto HTML> envía el texto a todos los usuarios"""
+    if not args:
+        return BROADCAST_USAGE
+    broadcast_id = broadcasts.create(args, 'HTML')
+    threading.Thread(target=broadcasts.run, args=(broadcast_id,), name="broadcast", daemon=True).start()
+    return prepare(f"📣 Difusión {broadcast_id} iniciada.")
+
+# Respuesta por defecto para guiar al usuario
+router.fallback(prepare("🤖 Usa los comandos del menú o escribe /start para ver las opciones."))
 
 # 4. RUTAS PARA WEBHOOKS (Integración con Hotmart y Telegram)
+# Latencia por ruta y /metrics en formato Prometheus
+instrument_flask(app)
+# Panel de ventas en el mismo proceso: lee el libro y los acumulados en memoria
+app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
+
 @app.route('/')
 def home():
     return "<h1>🚀 NEURAFORGEA BOT OPERATIVO</h1>", 200
 
+def update_chat_id(update):
+    """Chat al que pertenece un update (clave de orden); update_id si no hay chat"""
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if key in update:
+            return update[key]['chat']['id']
+    if 'callback_query' in update:
+        return update['callback_query']['from']['id']
+    return update.get('update_id')
+
+limiter = create_limiter(config.COOLDOWN_SECONDS, config.RATE_LIMIT_BURST, config.RATE_LIMIT_BACKEND)
+
+def update_user_id(update):
+    for key in ('message', 'edited_message', 'callback_query'):
+        if key in update and 'from' in update[key]:
+            return update[key]['from']['id']
+    return None
+
+# Al limitado se le avisa una vez por ventana de cooldown; lo demás se descarta en silencio
+cooldown_notices = MemoryLimiter(1.0 / config.COOLDOWN_SECONDS)
+COOLDOWN_TEXT = "⏱️ Vas muy rápido. Espera {segundos} s y vuelve a intentarlo."
+
+def cooldown_reply(user_id):
+    """Payload "espera N s" para un usuario limitado, o None si ya se le avisó en esta ventana"""
+    if not cooldown_notices.allow(user_id):
+        return None
+    segundos = max(1, math.ceil(limiter.retry_after(user_id)))
+    return prepare(COOLDOWN_TEXT.format(segundos=segundos))
+
+def procesar_update(update):
+    """Worker de fondo: pasa el update al router de comandos"""
+    # Límite por usuario antes de despachar: el spam no llega a los handlers
+    user_id = update_user_id(update)
+    if user_id is not None and not limiter.allow(user_id):
+        logger.info("⏱️ Usuario %s limitado por cooldown.", user_id, extra=SAMPLE)
+        aviso = cooldown_reply(user_id)
+        if aviso is not None and 'message' in update:
+            router.reply(update['message'], aviso)
+        return
+    router.dispatch(update)
+
+# Orden por chat; un chat que debe esperar su límite de Telegram se aparta sin ocupar hilo
+update_queue = KeyedWorkerPool(
+    "updates",
+    procesar_update,
+    workers=config.UPDATE_WORKERS,
+    maxsize=config.UPDATE_QUEUE_SIZE,
+    delay=sender.chat_delay,
+)
+seen_updates = RecentIds(config.UPDATE_DEDUPE_WINDOW)
+
 @app.route('/telegram-webhook', methods=['POST'])
 def telegram_webhook():
-    if request.headers.get('content-type') == 'application/json':
-        json_string = request.get_data().decode('utf-8')
-        update = telebot.types.Update.de_json(json_string)
-        bot.process_new_updates([update])
+    if request.headers.get('content-type') != 'application/json':
+        return 'forbidden', 403
+    try:
+        update = json.loads(request.get_data())
+        update_id = update['update_id']
+        chat_id = update_chat_id(update)
+    except (ValueError, KeyError, TypeError):
+        return 'bad request', 400
+
+    # Reentregas de Telegram: ya las tenemos, se confirman sin reprocesar
+    if not seen_updates.add(update_id):
         return 'ok', 200
-    return 'forbidden', 403
+    if not update_queue.submit(chat_id, update):
+        seen_updates.discard(update_id)
+        logger.warning("⚠️ Cola de updates llena, Telegram lo reintentará.")
+        return 'busy', 503
+    return 'ok', 200
+
+hotmart_events = IdempotencyStore(
+    ttl_seconds=config.HOTMART_EVENT_TTL_DAYS * 86400,
+    cache_size=config.HOTMART_EVENT_CACHE_SIZE,
+)
+
+def registrar_en_libro(venta):
+    """Escribe la venta en el libro reintentando con backoff si SQLite falla o tarda"""
+    for attempt in range(config.HOTMART_LEDGER_RETRIES + 1):
+        try:
+            return ledger.record(venta['producto'], venta['comision'], key=venta['key'])
+        except (sqlite3.Error, TimeoutError) as e:
+            if attempt >= config.HOTMART_LEDGER_RETRIES:
+                raise
+            delay = min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warning("⏳ Libro de ventas falló (%s), reintento %s en %.2fs", e, attempt + 1, delay)
+            time.sleep(delay)
+
+def notificar_venta(venta):
+    """Worker de fondo: registra una venta ya validada y avisa al administrador"""
+    key = venta['key']
+    if key and hotmart_events.seen(key):
+        logger.info("♻️ Evento de Hotmart duplicado ignorado: %s", key, extra=SAMPLE)
+        return
+    notificacion = (
+        f"💰 <b>¡NUEVA VENTA CONFIRMADA!</b> 💰\n\n"
+        f"👤 <b>Cliente:</b> {venta['comprador']}\n"
+        f"📦 <b>Producto:</b> {venta['producto']}\n"
+        f"💵 <b>Tu Comisión:</b> ${venta['comision']} USD\n\n"
+        f"✅ <i>El sistema ha registrado el pago correctamente.</i>"
+    )
+    # Cada paso es idempotente por la clave del evento (ventas.clave en el libro,
+    # referral_credits en los abonos) y el evento solo se marca procesado al final:
+    # un reintento desde el outbox (proceso caído a mitad, libro o Telegram fallando)
+    # completa lo que faltaba sin duplicar lo ya hecho. El aviso al administrador
+    # es al menos una vez: puede repetirse si caemos justo entre el envío y el claim.
+    nueva = registrar_en_libro(venta)
+    if not nueva:
+        logger.info("♻️ Venta %s ya estaba en el libro; se completan los pasos pendientes.", key)
+    if venta['afiliado'] is not None:
+        if referrals.credit_sale(venta['afiliado'], float(venta['comision']), key=key) is not None:
+            # El src del link (neuroforge_<id>) une la compra con el usuario del bot en el embudo
+            analytics.track(venta['afiliado'], 'purchase')
+            if config.AUTO_REMINDERS:
+                reminders.cancel(venta['afiliado'], 'link_followup')
+    sender.send_message(ADMIN_ID, notificacion, parse_mode='HTML')
+    logger.info("💸 Notificación de venta enviada al administrador.")
+    if key and not hotmart_events.claim(key):
+        # Otro worker lo terminó a la vez (lease vencido a mitad): los abonos ya eran únicos
+        logger.info("♻️ Evento de Hotmart %s ya procesado por otro worker.", key)
+
+# Cada venta aceptada queda en SQLite antes del 200: un redeploy no la pierde
+hotmart_outbox = Outbox("hotmart", lease_seconds=config.HOTMART_OUTBOX_LEASE)
+
+def atender_venta(item):
+    item_id, venta = item
+    try:
+        notificar_venta(venta)
+    except Exception:
+        # Solo se borra lo terminado: si algo falla, vuelve a la cola al vencer su lease
+        hotmart_outbox.release(item_id)
+        raise
+    hotmart_outbox.done(item_id)
+
+hotmart_queue = WorkerPool(
+    "hotmart",
+    atender_venta,
+    maxsize=config.HOTMART_QUEUE_SIZE,
+    workers=config.HOTMART_WORKERS,
+    policy=config.HOTMART_QUEUE_POLICY,
+    timeout=config.HOTMART_QUEUE_TIMEOUT,
+)
+
+def recibir_venta(data):
+    """Valida un webhook de Hotmart, lo guarda en el outbox y lo encola; devuelve (cuerpo, status).
+
+    La comparten /hotmart-webhook de Flask y el de async_bot.py (desde su executor:
+    escribe en SQLite).
+    """
+    if not isinstance(data, dict):
+        return {"error": "payload inválido"}, 400
+
+    # Solo las compras aprobadas generan trabajo; el resto se confirma sin más
+    if data.get("event") != "PURCHASE_APPROVED":
+        return {"status": "received"}, 200
+
+    key = event_key(data)
+    if key and hotmart_events.seen(key):
+        return {"status": "duplicate"}, 200
+
+    try:
+        venta = {
+            "key": key,
+            "comprador": data['data']['buyer']['name'],
+            "producto": data['data']['product']['name'],
+            "comision": data['data']['commission']['value'],
+            "afiliado": parse_src(purchase_src(data)),
+        }
+    except (KeyError, TypeError) as e:
+        logger.error("❌ Error en Hotmart Webhook: campo ausente %s", e)
+        return {"error": f"campo ausente: {e}"}, 400
+
+    try:
+        item_id = hotmart_outbox.add(venta, key)
+    except sqlite3.Error as e:
+        # Sin guardarlo no lo confirmamos: Hotmart reintentará
+        logger.error("❌ No se pudo guardar el evento de Hotmart: %s", e)
+        return {"status": "busy"}, 503
+    if item_id is None:
+        return {"status": "duplicate"}, 200
+
+    if not hotmart_queue.submit((item_id, venta)):
+        # Ya está guardado: el barrido del outbox lo procesa al vencer su lease
+        hotmart_outbox.release(item_id)
+        logger.warning("⚠️ Cola de Hotmart llena, el evento espera en el outbox.")
+    return {"status": "received"}, 200
 
 @app.route('/hotmart-webhook', methods=['POST'])
 def hotmart_webhook():
-    """Recibe notificaciones de ventas de Hotmart y te avisa al Telegram"""
-    try:
-        data = request.get_json()
-        # Verificamos si es una compra aprobada
-        if data.get("event") == "PURCHASE_APPROVED":
-            comprador = data['data']['buyer']['name']
-            producto = data['data']['product']['name']
-            comision = data['data']['commission']['value']
-            
-            notificacion = (
-                f"💰 <b>¡NUEVA VENTA CONFIRMADA!</b> 💰\n\n"
-                f"👤 <b>Cliente:</b> {comprador}\n"
-                f"📦 <b>Producto:</b> {producto}\n"
-                f"💵 <b>Tu Comisión:</b> ${comision} USD\n\n"
-                f"✅ <i>El sistema ha registrado el pago correctamente.</i>"
-            )
-            bot.send_message(ADMIN_ID, notificacion, parse_mode='HTML')
-            logger.info("💸 Notificación de venta enviada al administrador.")
-            
-        return jsonify({"status": "received"}), 200
-    except Exception as e:
-        logger.error(f"❌ Error en Hotmart Webhook: {e}")
-        return jsonify({"error": str(e)}), 500
+    """Recibe notificaciones de ventas de Hotmart, las encola y responde al instante"""
+    body, status = recibir_venta(request.get_json(silent=True))
+    return jsonify(body), status
+
+# Profundidad de colas y contadores del sender: se leen solo al hacer scrape
+registry.gauge_callback("queue_depth", "Elementos pendientes por cola", lambda: {
+    "hotmart": hotmart_queue.depth(),
+    "updates": update_queue.depth(),
+    "ledger": ledger.depth(),
+    "hotmart_outbox": hotmart_outbox.depth(),
+}, ["queue"])
+registry.gauge_callback("outbox_dead_letters", "Eventos del outbox que agotaron sus intentos",
+                        lambda: {"hotmart": hotmart_outbox.dead()}, ["queue"])
+registry.gauge_callback("telegram_messages_total", "Resultado de los envíos a Telegram",
+                        sender.stats, ["result"], kind="counter")
 
 # 5. ARRANQUE DEL SISTEMA
-if __name__ == '__main__':
-    # Configuración automática del Webhook en Render
+def ensure_webhook(url, lock_path=config.WEBHOOK_LOCK_FILE):
+    """Registra el webhook solo si Telegram tiene otro; lo hace un único worker.
+
+    El primer worker que toma el lock (y lo conserva mientras viva) compara
+    getWebhookInfo con la URL deseada: en un redeploy normal no hay cambio y
+    nos ahorramos el delete/set, que además dejaba un hueco sin updates.
+    """
+    global _webhook_lock
+    lock = open(lock_path, 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    _webhook_lock = lock
+    try:
+        info = sender.call('getWebhookInfo', {})
+        if info.get('url') == url:
+            logger.info("🌐 Webhook ya configurado en: %s", url)
+        else:
+            sender.call('setWebhook', {'url': url})
+            logger.info("🌐 Webhook configurado en: %s", url)
+    except SendError as e:
+        logger.error("❌ No se pudo verificar el webhook: %s %s", e.error_code, e.description)
+    return True
+
+_webhook_lock = None
+_started = False
+_start_lock = threading.Lock()
+
+def start_background():
+    """Hilos de fondo del bot, una vez por proceso (los usan create_app y async_bot.py)"""
+    global _started
+    with _start_lock:
+        if _started:
+            return False
+        _started = True
+
+    # Tablas del bot (users) antes de atender el primer /start
+    database.init_db()
+    # Acumulados cargados desde el arranque: cada lote del libro llega al panel como delta
+    ledger.init_db()
+    aggregates.snapshot()
+    analytics.start()
+    # Ventas aceptadas que otro proceso no llegó a terminar (o que falló): se reencolan
+    hotmart_outbox.start(lambda item_id, venta: hotmart_queue.submit((item_id, venta)),
+                         interval=config.HOTMART_OUTBOX_SWEEP_SECONDS)
+    atexit.register(hotmart_outbox.release_owned)
+    if config.AUTO_REMINDERS:
+        reminders.start()
+    # Una difusión cortada por un redeploy sigue donde quedó (el lease evita duplicarla)
+    threading.Thread(target=broadcasts.resume_pending, name="broadcast-resume", daemon=True).start()
+    return True
+
+def create_app():
+    """Fábrica para gunicorn (`main:create_app()`): arranca los hilos de fondo una sola vez"""
+    if not start_background():
+        return app
+
+    # Configuración automática del Webhook en Render, sin bloquear el arranque
     render_url = os.getenv('RENDER_EXTERNAL_URL')
     if render_url:
-        webhook_path = f"{render_url}/telegram-webhook"
-        bot.remove_webhook()
-        bot.set_webhook(url=webhook_path)
-        logger.info(f"🌐 Webhook configurado en: {webhook_path}")
-    
+        threading.Thread(target=ensure_webhook, args=(f"{render_url}/telegram-webhook",),
+                         name="webhook-setup", daemon=True).start()
+
+    startup = time.perf_counter() - BOOT_STARTED
+    registry.gauge_callback("startup_seconds", "Tiempo de arranque del worker", lambda: startup)
+    logger.info("🚀 Worker %s listo en %.0f ms", os.getpid(), startup * 1000)
+    return app
+
+if __name__ == '__main__':
     port = int(os.environ.get('PORT', 10000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
@@ -0,0 +1,203 @@
+# metrics.py
+import time
+from bisect import bisect_left
+
+# Cubetas por defecto (segundos): de 0.5 ms a 10 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {child.value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float("inf"),), list(child.counts)):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {child.sum}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {child.count}")
+        return lines
+
+
+class CallbackGauge:
+    """Valor calculado solo al hacer scrape (profundidad de colas, contadores ajenos...)"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback, labelnames=(), kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.callback()
+        except Exception:
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            lines.append(f"{self.name}{_labels(self.labelnames, label_values)} {value}")
+        return lines
+
+
+class Registry:
+    """Registro de métricas de este proceso, expuesto en formato texto de Prometheus.
+
+    Observar no toma locks: son sumas sobre enteros/floats bajo el GIL, del
+    orden de cientos de nanosegundos. Con mucha contención alguna
+    observación puede perderse, lo cual es aceptable para métricas.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, callback, labelnames=(), kind="gauge"):
+        metric = CallbackGauge(name, documentation, callback, labelnames, kind)
+        self._metrics[name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Latencia de las rutas Flask", ["route", "method"])
+HTTP_RESPONSES = registry.counter(
+    "http_responses_total", "Respuestas HTTP por ruta y código", ["route", "status"])
+HANDLER_LATENCY = registry.histogram(
+    "bot_handler_duration_seconds", "Latencia de los handlers del bot por comando", ["command"])
+TELEGRAM_LATENCY = registry.histogram(
+    "telegram_api_duration_seconds", "Latencia de las llamadas salientes a la Bot API", ["method"])
+TELEGRAM_ERRORS = registry.counter(
+    "telegram_api_errors_total", "Errores de la Bot API por código (0 = red)", ["method", "code"])
+DB_LATENCY = registry.histogram(
+    "db_transaction_duration_seconds", "Duración de las transacciones SQLite", ["db"])
+
+
+def instrument_flask(app, endpoint='/metrics'):
+    """Mide todas las rutas de `app` y expone el registro en `endpoint`"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_LATENCY.labels(route, request.method).observe(time.perf_counter() - start)
+            HTTP_RESPONSES.labels(route, response.status_code).inc()
+        return response
+
+    @app.route(endpoint)
+    def metrics_endpoint():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
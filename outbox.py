@@ -0,0 +1,166 @@
+# outbox.py
+import json
+import logging
+import os
+import threading
+import time
+
+from database import DEFAULT_DB, get_pool
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        queue TEXT NOT NULL,
+        event_key TEXT,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        owner TEXT,
+        lease_until REAL NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_key ON outbox (queue, event_key);
+    CREATE INDEX IF NOT EXISTS idx_outbox_lease ON outbox (queue, lease_until);
+'''
+
+
+class Outbox:
+    """Eventos aceptados y aún no procesados, guardados en SQLite antes de responder.
+
+    `add` es un INSERT en WAL (sin fsync con synchronous=NORMAL) y deja el
+    evento con lease de este proceso mientras viaja por la cola en memoria;
+    `done` lo borra al terminar. Mientras un evento está en vuelo (en la cola
+    o en un handler) cada barrido renueva su lease, así que una cola lenta no
+    lo reparte dos veces. Lo que no se termina (redeploy, reinicio, handler
+    que falla y llama a `release`, cola llena) vuelve a repartirse cuando
+    vence su lease: el barrido lo toma con un UPDATE atómico, así que dos
+    workers no procesan el mismo evento a la vez. Tras `max_attempts`
+    repartos el evento se queda aparcado (`dead`) y se avisa en el log.
+    """
+
+    def __init__(self, name, db_path=DEFAULT_DB, lease_seconds=120, max_attempts=20):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        self._pool = get_pool(db_path)
+        self._ready = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._dead_seen = 0
+
+    def init_db(self):
+        self._pool.connection().executescript(SCHEMA)
+        self._ready = True
+
+    def _transaction(self):
+        if not self._ready:
+            self.init_db()
+        return self._pool.transaction()
+
+    def add(self, payload, key=None):
+        """Guarda el evento; devuelve su id, o None si `key` ya estaba pendiente"""
+        with self._transaction() as conn:
+            cur = conn.execute(
+                'INSERT OR IGNORE INTO outbox (queue, event_key, payload, attempts, owner, lease_until) '
+                'VALUES (?, ?, ?, 1, ?, ?)',
+                (self.name, key, json.dumps(payload), self.owner, time.time() + self.lease_seconds),
+            )
+        if cur.rowcount != 1:
+            return None
+        with self._lock:
+            self._in_flight.add(cur.lastrowid)
+        return cur.lastrowid
+
+    def done(self, item_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM outbox WHERE id = ?', (item_id,))
+        self.release(item_id)
+
+    def release(self, item_id):
+        """Deja de renovar el lease de `item_id`: al vencer, el barrido lo reintenta"""
+        with self._lock:
+            self._in_flight.discard(item_id)
+
+    def renew(self):
+        """Extiende el lease de lo que este proceso tiene en vuelo"""
+        with self._lock:
+            ids = list(self._in_flight)
+        lease_until = time.time() + self.lease_seconds
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            with self._transaction() as conn:
+                conn.execute(
+                    f'UPDATE outbox SET lease_until = ? WHERE owner = ? AND id IN ({",".join("?" * len(chunk))})',
+                    (lease_until, self.owner, *chunk),
+                )
+
+    def due(self, limit=100):
+        """Toma los eventos con lease vencido y devuelve [(id, payload)]"""
+        now = time.time()
+        lease_until = now + self.lease_seconds
+        with self._transaction() as conn:
+            conn.execute('''
+                UPDATE outbox SET owner = ?, lease_until = ?, attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE queue = ? AND lease_until < ? AND attempts < ?
+                    ORDER BY id LIMIT ?
+                )
+            ''', (self.owner, lease_until, self.name, now, self.max_attempts, limit))
+            rows = conn.execute(
+                'SELECT id, payload FROM outbox WHERE queue = ? AND owner = ? AND lease_until = ? ORDER BY id',
+                (self.name, self.owner, lease_until),
+            ).fetchall()
+        with self._lock:
+            self._in_flight.update(item_id for item_id, _ in rows)
+        return [(item_id, json.loads(payload)) for item_id, payload in rows]
+
+    def dead(self):
+        """Eventos que agotaron `max_attempts` y ya no se reparten"""
+        return self._pool.connection().execute(
+            'SELECT COUNT(*) FROM outbox WHERE queue = ? AND attempts >= ?', (self.name, self.max_attempts)
+        ).fetchone()[0]
+
+    def release_owned(self):
+        """Al apagar: lo que este proceso no terminó queda libre para el siguiente worker"""
+        with self._transaction() as conn:
+            cur = conn.execute('UPDATE outbox SET lease_until = 0 WHERE queue = ? AND owner = ?',
+                               (self.name, self.owner))
+        if cur.rowcount:
+            logger.info("📮 %s eventos de %s liberados para otro worker.", cur.rowcount, self.name)
+
+    def depth(self):
+        return self._pool.connection().execute(
+            'SELECT COUNT(*) FROM outbox WHERE queue = ?', (self.name,)
+        ).fetchone()[0]
+
+    def start(self, submit, interval=10):
+        """Hilo que reencola lo vencido con `submit(id, payload) -> bool`; la primera pasada es inmediata"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(submit, interval),
+                                            name=f"outbox-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self, submit, interval):
+        while True:
+            try:
+                self.renew()
+                items = self.due()
+                for item_id, payload in items:
+                    if not submit(item_id, payload):
+                        self.release(item_id)
+                if items:
+                    logger.info("📮 %s eventos pendientes de %s reencolados.", len(items), self.name)
+                dead = self.dead()
+                if dead > self._dead_seen:
+                    logger.error("☠️ %s eventos de %s agotaron %s intentos; revisar la tabla outbox.",
+                                 dead, self.name, self.max_attempts)
+                self._dead_seen = dead
+            except Exception as e:
+                logger.error("❌ Error revisando el outbox %s: %s", self.name, e)
+            time.sleep(interval)
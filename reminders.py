@@ -0,0 +1,174 @@
+# reminders.py
+import heapq
+import logging
+import os
+import threading
+import time
+
+from database import DEFAULT_DB, get_pool
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderScheduler:
+    """Recordatorios persistentes en SQLite con un min-heap en memoria para la próxima ventana.
+
+    - La tabla `reminders` (indexada por due_at) guarda todo lo pendiente, así
+      que un reinicio no pierde nada.
+    - En memoria solo vive lo que vence en los próximos `window` segundos
+      (hasta `max_loaded` filas). El hilo duerme en una Condition hasta el
+      siguiente vencimiento exacto: entre eventos no gasta CPU, haya 10 o
+      100k pendientes.
+    - Lo vencido se despacha en lotes. Cada fila se reclama en SQLite antes
+      de enviarse, de modo que varios workers de gunicorn no la dupliquen.
+    """
+
+    def __init__(self, dispatch, db_path=DEFAULT_DB, window=3600, max_loaded=10000,
+                 batch_size=100, claim_timeout=300):
+        self.dispatch = dispatch
+        self.window = window
+        self.max_loaded = max_loaded
+        self.batch_size = batch_size
+        self.claim_timeout = claim_timeout
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        self._pool = get_pool(db_path)
+        self._ready = False
+        self._heap = []
+        self._loaded = set()
+        self._loaded_until = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def init_db(self):
+        with self._pool.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS reminders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    telegram_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    due_at REAL NOT NULL,
+                    claimed_by TEXT,
+                    claimed_at REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (due_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_reminders_user_kind ON reminders (telegram_id, kind)')
+        self._ready = True
+
+    def _transaction(self):
+        if not self._ready:
+            self.init_db()
+        return self._pool.transaction()
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="reminders", daemon=True)
+                self._thread.start()
+
+    def schedule(self, telegram_id, text, delay=None, due_at=None, kind="custom"):
+        """Programa un recordatorio para dentro de `delay` segundos (o en el instante `due_at`)"""
+        due_at = due_at if due_at is not None else time.time() + delay
+        with self._transaction() as conn:
+            cur = conn.execute(
+                'INSERT INTO reminders (telegram_id, kind, text, due_at) VALUES (?, ?, ?, ?)',
+                (telegram_id, kind, text, due_at),
+            )
+        with self._cond:
+            # Si cae dentro de la ventana cargada entra al heap; si no, lo traerá la recarga
+            if due_at < self._loaded_until:
+                self._push(due_at, cur.lastrowid, telegram_id, text)
+                if self._heap[0][1] == cur.lastrowid:
+                    self._cond.notify()
+        return cur.lastrowid
+
+    def cancel(self, telegram_id, kind):
+        """Anula los pendientes de un tipo (p. ej. el seguimiento de /link tras una compra)"""
+        with self._transaction() as conn:
+            cur = conn.execute(
+                'DELETE FROM reminders WHERE telegram_id = ? AND kind = ? AND claimed_by IS NULL',
+                (telegram_id, kind),
+            )
+        # Lo que siga en el heap se descarta al reclamarlo: ya no existe en la tabla
+        return cur.rowcount
+
+    def pending(self):
+        with self._transaction() as conn:
+            return conn.execute('SELECT COUNT(*) FROM reminders').fetchone()[0]
+
+    def _push(self, due_at, reminder_id, telegram_id, text):
+        if reminder_id not in self._loaded:
+            self._loaded.add(reminder_id)
+            heapq.heappush(self._heap, (due_at, reminder_id, telegram_id, text))
+
+    def _refill(self, now):
+        """Carga en el heap lo no reclamado que vence antes del nuevo horizonte"""
+        horizon = now + self.window
+        with self._transaction() as conn:
+            rows = conn.execute('''
+                SELECT due_at, id, telegram_id, text FROM reminders
+                WHERE due_at < ? AND (claimed_by IS NULL OR claimed_at < ?)
+                ORDER BY due_at LIMIT ?
+            ''', (horizon, now - self.claim_timeout, self.max_loaded)).fetchall()
+        with self._cond:
+            for row in rows:
+                self._push(*row)
+            # Si tocamos el límite, la ventana termina en la última fila cargada
+            self._loaded_until = rows[-1][0] if len(rows) == self.max_loaded else horizon
+
+    def _claim(self, batch, now):
+        ids = [reminder_id for _, reminder_id, _, _ in batch]
+        marks = ','.join('?' * len(ids))
+        with self._transaction() as conn:
+            conn.execute(f'''
+                UPDATE reminders SET claimed_by = ?, claimed_at = ?
+                WHERE id IN ({marks}) AND (claimed_by IS NULL OR claimed_at < ?)
+            ''', [self.owner, now, *ids, now - self.claim_timeout])
+            mine = {row[0] for row in conn.execute(
+                f'SELECT id FROM reminders WHERE id IN ({marks}) AND claimed_by = ? AND claimed_at = ?',
+                [*ids, self.owner, now],
+            )}
+        return [item for item in batch if item[1] in mine]
+
+    def _run(self):
+        while True:
+            now = time.time()
+            if now >= self._loaded_until:
+                try:
+                    self._refill(now)
+                except Exception as e:
+                    logger.error("❌ Error cargando recordatorios: %s", e)
+                    time.sleep(5)
+                    continue
+
+            with self._cond:
+                due = []
+                while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                    item = heapq.heappop(self._heap)
+                    self._loaded.discard(item[1])
+                    due.append(item)
+                if not due:
+                    # Dormimos justo hasta el próximo vencimiento (o el fin de la ventana)
+                    wake = min(self._heap[0][0], self._loaded_until) if self._heap else self._loaded_until
+                    self._cond.wait(max(0.0, wake - now))
+                    continue
+
+            try:
+                self._send(due, now)
+            except Exception as e:
+                logger.error("❌ Error despachando recordatorios: %s", e)
+
+    def _send(self, batch, now):
+        batch = self._claim(batch, now)
+        if not batch:
+            return
+        for _, reminder_id, telegram_id, text in batch:
+            try:
+                self.dispatch(telegram_id, text)
+            except Exception as e:
+                # No se reintenta: un usuario que bloqueó el bot fallaría para siempre
+                logger.error("❌ Recordatorio %s para %s falló: %s", reminder_id, telegram_id, e)
+        with self._transaction() as conn:
+            conn.executemany('DELETE FROM reminders WHERE id = ?', [(item[1],) for item in batch])
+        logger.info("⏰ %s recordatorios despachados.", len(batch))
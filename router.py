@@ -0,0 +1,112 @@
+# router.py
+import time
+
+from metrics import HANDLER_LATENCY
+
+
+def prepare(text, parse_mode=None, **extra):
+    """Payload de sendMessage armado una vez; al enviarlo solo se añade el destino"""
+    payload = {"text": text}
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    payload.update(extra)
+    return payload
+
+
+def extract_command(text):
+    """'/start@MiBot ref12' -> ('start', 'ref12'); None si el texto no es un comando"""
+    if not text or text[0] != '/':
+        return None, None
+    parts = text.split(maxsplit=1)
+    name = parts[0][1:].split('@', 1)[0]
+    return name, parts[1] if len(parts) > 1 else ''
+
+
+class _Route:
+    __slots__ = ("handler", "payload", "allow", "label", "latency")
+
+    def __init__(self, handler, payload, allow, label):
+        self.handler = handler
+        self.payload = payload
+        self.allow = allow
+        self.label = label
+        self.latency = HANDLER_LATENCY.labels(label)
+
+    def respond(self, message, args):
+        """Payload de respuesta (o None); el envío lo hace quien despacha"""
+        if self.handler is None:
+            return self.payload
+        return self.handler(message, args)
+
+
+class CommandRouter:
+    """Despacho de mensajes del bot sobre el update crudo de Telegram (dict).
+
+    El comando se extrae una vez y se busca en un dict, sin recorrer una
+    lista de filtros ni construir objetos por update. Las respuestas fijas
+    son payloads preparados al arrancar; el texto que no es un comando va
+    directo a la respuesta por defecto.
+
+    Los handlers devuelven el payload de respuesta en vez de enviarlo, así
+    sirven igual al runtime síncrono (`dispatch`) y al de asyncio
+    (async_bot.py, que usa `resolve` y envía con su propia sesión).
+    """
+
+    def __init__(self, sender, tracker=None):
+        self.sender = sender
+        # tracker(user_id, etiqueta) por cada mensaje atendido (analítica del embudo)
+        self.tracker = tracker
+        self._routes = {}
+        self._fallback = None
+
+    def command(self, *names, allow=None, label=None):
+        """Decorador: `handler(message, args) -> payload | None` para /name (si `allow(message)` lo permite)"""
+        def decorator(handler):
+            route = _Route(handler, None, allow, label or names[0])
+            for name in names:
+                self._routes[name] = route
+            return handler
+        return decorator
+
+    def static(self, *names, payload, label=None):
+        """Comandos que solo responden con un payload fijo"""
+        route = _Route(None, payload, None, label or names[0])
+        for name in names:
+            self._routes[name] = route
+
+    def fallback(self, payload=None, handler=None, label='otros'):
+        """Respuesta a todo texto que no sea un comando conocido"""
+        self._fallback = _Route(handler, payload, None, label)
+
+    def reply(self, message, payload):
+        return self.sender.send_prepared(message['chat']['id'], payload, reply_to_message_id=message['message_id'])
+
+    def resolve(self, update):
+        """(message, route, args) para un update, o None si nadie lo atiende"""
+        message = update.get('message')
+        if message is None or 'text' not in message:
+            return None
+        name, args = extract_command(message['text'])
+        route = self._routes.get(name) if name is not None else None
+        if route is None or (route.allow is not None and not route.allow(message)):
+            route = self._fallback
+            if route is None:
+                return None
+        if self.tracker is not None:
+            self.tracker(message['from']['id'], route.label)
+        return message, route, args
+
+    def dispatch(self, update):
+        """Procesa un update; devuelve True si algún handler lo atendió"""
+        resolved = self.resolve(update)
+        if resolved is None:
+            return False
+        message, route, args = resolved
+        start = time.perf_counter()
+        try:
+            payload = route.respond(message, args)
+            if payload is not None:
+                self.reply(message, payload)
+        finally:
+            route.latency.observe(time.perf_counter() - start)
+        return True
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+MICRO-BENCHMARK DEL DESPACHO DE COMANDOS
+Compara el coste por update de la cadena de handlers de telebot (como estaba
+antes) con el router por dict de router.py. Los handlers y el sender no
+hacen nada: solo se mide el despacho.
+
+Uso: python scripts/bench_dispatch.py [--updates 200000]
+La comparación con telebot necesita `pip install -r requirements-bench.txt`.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router import CommandRouter, prepare  # noqa: E402
+
+ADMIN_ID = "1"
+TEXTS = ["/start", "/start ref42", "/link", "/info", "/curso", "/difundir hola", "hola", "¿cuánto cuesta?"]
+
+
+class NullSender:
+    def send_prepared(self, chat_id, prepared, reply_to_message_id=None):
+        return None
+
+    def send_message(self, chat_id, text, **kwargs):
+        return None
+
+    def reply_to(self, message, text, **kwargs):
+        return None
+
+
+def make_updates(n):
+    updates = []
+    for i in range(n):
+        chat = 1000 + i % 50
+        updates.append({
+            "update_id": i,
+            "message": {
+                "message_id": i, "date": 0, "text": TEXTS[i % len(TEXTS)],
+                "chat": {"id": chat, "type": "private"},
+                "from": {"id": chat, "is_bot": False, "first_name": "Bench"},
+            },
+        })
+    return updates
+
+
+def build_router():
+    router = CommandRouter(NullSender())
+    noop = lambda message, args: None  # noqa: E731
+    router.command('start', 'help')(noop)
+    router.command('link')(noop)
+    router.static('info', 'curso', payload=prepare("info", parse_mode='HTML'))
+    router.command('difundir', allow=lambda message: str(message['from']['id']) == ADMIN_ID)(noop)
+    router.fallback(prepare("🤖 Usa los comandos del menú"))
+    return router.dispatch
+
+
+def build_telebot():
+    import telebot
+    bot = telebot.TeleBot("123456:BENCH", threaded=False)
+    noop = lambda message: None  # noqa: E731
+    bot.register_message_handler(noop, commands=['start', 'help'])
+    bot.register_message_handler(noop, commands=['link'])
+    bot.register_message_handler(noop, commands=['info', 'curso'])
+    bot.register_message_handler(noop, commands=['difundir'], func=lambda message: str(message.from_user.id) == ADMIN_ID)
+    bot.register_message_handler(noop, func=lambda message: True)
+
+    def dispatch(update):
+        bot.process_new_updates([telebot.types.Update.de_json(update)])
+    return dispatch
+
+
+def measure(name, dispatch, updates):
+    for update in updates[:1000]:
+        dispatch(update)
+    start = time.perf_counter()
+    for update in updates:
+        dispatch(update)
+    per_update = (time.perf_counter() - start) / len(updates) * 1e6
+    print(f"  {name:10} {per_update:8.2f} µs/update")
+    return per_update
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste de despacho por update")
+    parser.add_argument("--updates", type=int, default=200000)
+    args = parser.parse_args()
+
+    updates = make_updates(args.updates)
+    print(f"⏱️ {args.updates} updates ({len(TEXTS)} textos distintos)")
+    after = measure("router", build_router(), updates)
+    try:
+        before = measure("telebot", build_telebot(), updates)
+    except ImportError:
+        print("  telebot no instalado: solo se mide el router")
+        return
+    print(f"  ➜ {before / after:.1f}x más rápido")
+
+
+if __name__ == "__main__":
+    main()
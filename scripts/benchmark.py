@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+PRUEBA DE CARGA DEL BOT Y DEL DASHBOARD
+Levanta un Telegram falso, arranca main.py (con el dashboard montado en
+/dashboard) en una carpeta temporal y le dispara tráfico sintético a ritmo controlado.
+
+Uso:
+    python scripts/benchmark.py --rate 200 --duration 10 --output bench.json
+    python scripts/benchmark.py --compare bench_anterior.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_telegram import FakeTelegram
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVE = """
+import sys
+from werkzeug.serving import run_simple
+app = __import__(sys.argv[1]).create_app()
+run_simple('127.0.0.1', int(sys.argv[2]), app, threaded=True)
+"""
+
+COMMANDS = ["/start", "/link", "/info", "hola"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(module, workdir, env, server, workers):
+    port = free_port()
+    if server == "gunicorn":
+        cmd = ["gunicorn", f"{module}:create_app()", "-b", f"127.0.0.1:{port}",
+               "-w", str(workers), "-k", "gthread", "--threads", "8", "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-c", SERVE, module, str(port)]
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(url + "/", timeout=1)
+            return proc, url
+        except requests.RequestException:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{module} no arrancó (código {proc.returncode})")
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"{module} no respondió a tiempo")
+
+
+def scenarios(args, urls):
+    update_ids = itertools.count(1)
+    transactions = itertools.count(1)
+
+    def telegram():
+        uid = next(update_ids)
+        chat = random.randint(1, args.chats)
+        return "POST", urls["main"] + "/telegram-webhook", {
+            "update_id": uid,
+            "message": {
+                "message_id": uid, "date": int(time.time()), "text": random.choice(COMMANDS),
+                "chat": {"id": chat, "type": "private"},
+                "from": {"id": chat, "is_bot": False, "first_name": "Bench"},
+            },
+        }
+
+    def hotmart():
+        n = next(transactions)
+        return "POST", urls["main"] + "/hotmart-webhook", {
+            "id": f"bench-{n}",
+            "event": "PURCHASE_APPROVED",
+            "data": {
+                "purchase": {"transaction": f"BENCH{n}", "origin": {"src": f"neuroforge_{random.randint(1, args.chats)}"}},
+                "buyer": {"name": "Cliente Bench"},
+                "product": {"name": random.choice(["Curso Resina", "Bono"])},
+                "commission": {"value": 48.5},
+            },
+        }
+
+    def ventas():
+        return "GET", urls["main"] + "/dashboard/api/ventas", None
+
+    return {
+        "telegram-webhook": telegram,
+        "hotmart-webhook": hotmart,
+        "api-ventas": ventas,
+    }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def run_load(build_request, rate, duration, concurrency):
+    """Carga en lazo abierto: la latencia se mide desde el instante programado, no desde el envío"""
+    local = threading.local()
+    latencies, statuses, lock = [], {}, threading.Lock()
+
+    def fire(scheduled, method, url, payload):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        try:
+            resp = session.request(method, url, json=payload, timeout=30)
+            status = resp.status_code
+        except requests.RequestException:
+            status = "error"
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    total = int(rate * duration)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(total):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(fire, scheduled, *build_request())
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    ok = sum(n for status, n in statuses.items() if status in (200, 304))
+    return {
+        "target_rate": rate,
+        "requests": total,
+        "ok": ok,
+        "errors": total - ok,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "throughput": round(total / wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round((latencies[-1] if latencies else 0.0) * 1000, 3),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\n📐 Comparación con {baseline_path}")
+    for name, actual in results.items():
+        previo = baseline.get(name)
+        if not previo:
+            continue
+        for metric in ("p95_ms", "p99_ms", "throughput"):
+            antes, ahora = previo[metric], actual[metric]
+            if not antes:
+                continue
+            cambio = (ahora - antes) / antes
+            peor = cambio > threshold if metric != "throughput" else cambio < -threshold
+            marca = "❌" if peor else "✅"
+            print(f"  {marca} {name:18} {metric:10} {antes:>10} -> {ahora:>10} ({cambio:+.1%})")
+            if peor:
+                regressions.append((name, metric))
+    return regressions
+
+
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de main.py y su dashboard")
+    parser.add_argument("--rate", type=float, default=100, help="Peticiones por segundo por endpoint")
+    parser.add_argument("--duration", type=float, default=10, help="Segundos por endpoint")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--chats", type=int, default=5000, help="Usuarios sintéticos distintos")
+    parser.add_argument("--endpoints", default="telegram-webhook,hotmart-webhook,api-ventas")
+    parser.add_argument("--server", choices=["werkzeug", "gunicorn"], default="werkzeug")
+    parser.add_argument("--workers", type=int, default=2, help="Workers de gunicorn")
+    parser.add_argument("--tg-latency-ms", type=float, default=50)
+    parser.add_argument("--tg-rate-429", type=float, default=0.0)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Empeoramiento tolerado (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    fake = FakeTelegram(latency_ms=args.tg_latency_ms, rate_429=args.tg_rate_429).start()
+    workdir = tempfile.mkdtemp(prefix="neuraforge-bench-")
+    env = dict(os.environ, PYTHONPATH=REPO, TELEGRAM_TOKEN="123456:BENCH", TELEGRAM_API_URL=fake.url)
+    procs = []
+    try:
+        urls = {}
+        proc, urls["main"] = start_app("main", workdir, env, args.server, args.workers)
+        procs.append(proc)
+
+        builders = scenarios(args, urls)
+        results = {}
+        for name in args.endpoints.split(","):
+            print(f"🚀 {name}: {args.rate:g} req/s durante {args.duration:g}s")
+            results[name] = run_load(builders[name], args.rate, args.duration, args.concurrency)
+            r = results[name]
+            print(f"   {r['throughput']} req/s  p50 {r['p50_ms']}ms  p95 {r['p95_ms']}ms  "
+                  f"p99 {r['p99_ms']}ms  errores {r['errors']}")
+        # Dejamos que los workers de fondo terminen de hablar con Telegram
+        time.sleep(1)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=10)
+        fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_rev": git_rev(),
+        "config": vars(args),
+        "results": results,
+        "telegram": dict(fake.counters),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Resultados guardados en {args.output}  (Telegram falso: {fake.counters})")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
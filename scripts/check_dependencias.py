@@ -11,7 +11,6 @@ def check_and_install():
     
     required = [
         ("Flask", "flask"),
-        ("pyTelegramBotAPI", "telebot"),
         ("requests", "requests"),
         ("schedule", "schedule"),
     ]
@@ -29,10 +28,7 @@ def check_and_install():
     if missing:
         print(f"\n📦 Instalando {len(missing)} librerías...")
         for lib in missing:
-            if lib == "pyTelegramBotAPI":
-                subprocess.run([sys.executable, "-m", "pip", "install", "pyTelegramBotAPI"])
-            else:
-                subprocess.run([sys.executable, "-m", "pip", "install", lib])
+            subprocess.run([sys.executable, "-m", "pip", "install", lib])
         print("✅ Instalación completada")
     else:
         print("\n🎉 Todas las librerías están instaladas")
@@ -4,7 +4,6 @@ import subprocess
 
 libs = [
     ("flask", "Flask"),
-    ("telebot", "pyTelegramBotAPI"),
     ("requests", "requests"),
     ("schedule", "schedule"),
     ("git", "gitpython"),
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+SERVIDOR FALSO DE LA BOT API DE TELEGRAM (para pruebas de carga)
+Uso: python scripts/fake_telegram.py --port 8081 --latency-ms 50 --rate-429 0.01
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeTelegram:
+    """Acepta /bot<token>/<método> y responde como Telegram, con latencia y 429 configurables"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, rate_429=0.0, retry_after=1):
+        self.latency = latency_ms / 1000.0
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.counters = {"requests": 0, "ok": 0, "throttled": 0}
+        self._lock = threading.Lock()
+        self._message_id = 0
+        # Updates para getUpdates (long polling): push_update los encola
+        self._updates = []
+        self._updates_cond = threading.Condition(self._lock)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def push_update(self, update):
+        with self._updates_cond:
+            self._updates.append(update)
+            self._updates_cond.notify_all()
+
+    def _get_updates(self, body):
+        offset = body.get("offset") or 0
+        deadline = time.monotonic() + min(float(body.get("timeout") or 0), 1.0)
+        with self._updates_cond:
+            # El offset confirma (y descarta) todo lo anterior, como en Telegram
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._updates_cond.wait(deadline - time.monotonic())
+            return list(self._updates[:100])
+
+    def _respond(self, method, body=None):
+        self._count("requests")
+        if self.latency:
+            time.sleep(self.latency)
+        if self.rate_429 and random.random() < self.rate_429:
+            self._count("throttled")
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        self._count("ok")
+        if method == "getWebhookInfo":
+            return 200, {"ok": True, "result": {"url": "", "pending_update_count": 0}}
+        if method in ("setWebhook", "deleteWebhook"):
+            return 200, {"ok": True, "result": True}
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(body or {})}
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+        return 200, {"ok": True, "result": {"message_id": message_id, "date": int(time.time())}}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length)) if length else {}
+                except ValueError:
+                    request = {}
+                method = self.path.rstrip("/").rsplit("/", 1)[-1]
+                status, body = fake._respond(method, request)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-telegram", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot API falsa de Telegram")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fracción de respuestas 429 (0-1)")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    fake = FakeTelegram(args.host, args.port, args.latency_ms, args.rate_429, args.retry_after)
+    print(f"🤖 Telegram falso escuchando en {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 {fake.counters}")
+
+
+if __name__ == "__main__":
+    main()
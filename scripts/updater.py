@@ -9,37 +9,118 @@ import os
 import sys
 import json
 import shutil
+import sqlite3
+import hashlib
+import tempfile
 import subprocess
 from datetime import datetime
 import git
 
+EXCLUIR_DIRS = {'backups', '.git', '__pycache__'}
+EXCLUIR_SUFIJOS = ('-wal', '-shm', '-journal')
+BASES_DE_DATOS = ('.db', '.sqlite', '.sqlite3')
+
 class SafeUpdater:
     def __init__(self):
-        self.repo_path = os.path.dirname(os.path.abspath(__file__))
+        # El script vive en scripts/: la raíz del bot es la carpeta de arriba
+        self.repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.backup_dir = os.path.join(self.repo_path, "backups")
+        self.objects_dir = os.path.join(self.backup_dir, "objects")
         self.config_file = os.path.join(self.repo_path, "config.json")
         
+    def _archivos(self):
+        """Rutas relativas de todo lo que entra en un backup"""
+        for raiz, dirs, archivos in os.walk(self.repo_path):
+            dirs[:] = [d for d in dirs if d not in EXCLUIR_DIRS]
+            for nombre in archivos:
+                if nombre.endswith(EXCLUIR_SUFIJOS):
+                    continue
+                yield os.path.relpath(os.path.join(raiz, nombre), self.repo_path)
+
+    def _hash(self, ruta):
+        h = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(bloque)
+        return h.hexdigest()
+
+    def _blob(self, sha):
+        return os.path.join(self.objects_dir, sha[:2], sha)
+
+    def _guardar_blob(self, origen, sha):
+        """Copia al almacén solo si ese contenido no está ya guardado"""
+        destino = self._blob(sha)
+        if os.path.exists(destino):
+            return False
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        tmp = f"{destino}.tmp"
+        shutil.copyfile(origen, tmp)
+        os.replace(tmp, destino)
+        return True
+
+    def _copiar_db(self, origen, destino, paginas=256):
+        """Copia consistente de SQLite por bloques de páginas sin bloquear al bot"""
+        src = sqlite3.connect(origen)
+        dst = sqlite3.connect(destino)
+        try:
+            src.backup(dst, pages=paginas, sleep=0.005)
+        finally:
+            dst.close()
+            src.close()
+
+    def _manifiestos(self):
+        if not os.path.isdir(self.backup_dir):
+            return []
+        return sorted(d for d in os.listdir(self.backup_dir) if d.startswith('backup_'))
+
+    def _cargar_manifiesto(self, ruta):
+        with open(ruta) as f:
+            return json.load(f)
+
     def crear_backup(self):
-        """Crea backup completo antes de cualquier cambio"""
+        """Backup incremental: solo se guardan los contenidos nuevos más un manifiesto"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(self.backup_dir, f"backup_{timestamp}")
-        
+        backup_path = os.path.join(self.backup_dir, f"backup_{timestamp}.json")
+
         print(f"🛡️ Creando backup en: {backup_path}")
-        
-        # Copiar todo excepto backups y .git
-        os.makedirs(backup_path, exist_ok=True)
-        
-        for item in os.listdir(self.repo_path):
-            if item not in ['backups', '.git', '__pycache__']:
-                item_path = os.path.join(self.repo_path, item)
-                if os.path.isfile(item_path):
-                    shutil.copy2(item_path, backup_path)
-                elif os.path.isdir(item_path):
-                    shutil.copytree(item_path, os.path.join(backup_path, item))
-        
-        print(f"✅ Backup creado: {backup_path}")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        # Si tamaño y fecha no cambiaron desde el último manifiesto, el hash tampoco
+        anterior = {}
+        previos = [m for m in self._manifiestos() if m.endswith('.json')]
+        if previos:
+            anterior = self._cargar_manifiesto(os.path.join(self.backup_dir, previos[-1]))['files']
+
+        archivos, nuevos = {}, 0
+        for rel in self._archivos():
+            ruta = os.path.join(self.repo_path, rel)
+            st = os.stat(ruta)
+            if rel.endswith(BASES_DE_DATOS):
+                with tempfile.TemporaryDirectory(dir=self.backup_dir) as tmpdir:
+                    copia = os.path.join(tmpdir, os.path.basename(rel))
+                    self._copiar_db(ruta, copia)
+                    sha = self._hash(copia)
+                    nuevos += self._guardar_blob(copia, sha)
+                archivos[rel] = {"sha256": sha, "mode": st.st_mode, "db": True}
+                continue
+
+            previo = anterior.get(rel)
+            if previo and previo.get("size") == st.st_size and previo.get("mtime") == st.st_mtime \
+                    and os.path.exists(self._blob(previo["sha256"])):
+                sha = previo["sha256"]
+            else:
+                sha = self._hash(ruta)
+                nuevos += self._guardar_blob(ruta, sha)
+            archivos[rel] = {"sha256": sha, "mode": st.st_mode, "size": st.st_size, "mtime": st.st_mtime}
+
+        tmp = f"{backup_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"created": timestamp, "files": archivos}, f, indent=1)
+        os.replace(tmp, backup_path)
+
+        print(f"✅ Backup creado: {backup_path} ({len(archivos)} archivos, {nuevos} contenidos nuevos)")
         return backup_path
-    
+
     def verificar_estado_git(self):
         """Verifica estado de Git sin romper nada"""
         try:
@@ -91,34 +172,67 @@ class SafeUpdater:
         return True
     
     def restaurar_backup(self, backup_path=None):
-        """Restaura desde backup si algo sale mal"""
+        """Restaura desde backup si algo sale mal (solo reescribe lo que cambió)"""
         if not backup_path:
             # Buscar el backup más reciente
-            backups = sorted([d for d in os.listdir(self.backup_dir) 
-                            if d.startswith('backup_')])
+            backups = self._manifiestos()
             if backups:
                 backup_path = os.path.join(self.backup_dir, backups[-1])
-        
+        if not backup_path:
+            print("❌ No hay backups disponibles")
+            return
+
         print(f"🔄 Restaurando desde: {backup_path}")
-        
-        # Restaurar archivos
+        if os.path.isdir(backup_path):
+            self._restaurar_copia_completa(backup_path)
+            print("✅ Sistema restaurado exitosamente")
+            return
+
+        manifiesto = self._cargar_manifiesto(backup_path)
+        restaurados = 0
+        for rel, info in manifiesto["files"].items():
+            dst = os.path.join(self.repo_path, rel)
+            blob = self._blob(info["sha256"])
+            if info.get("db"):
+                # La base se restaura con la API de backup: respeta el WAL y a los lectores
+                if os.path.exists(dst) and self._hash_db(dst) == info["sha256"]:
+                    continue
+                self._copiar_db(blob, dst)
+            else:
+                if os.path.isfile(dst) and self._hash(dst) == info["sha256"]:
+                    continue
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                tmp = f"{dst}.restore"
+                shutil.copyfile(blob, tmp)
+                os.chmod(tmp, info["mode"] & 0o7777)
+                os.replace(tmp, dst)
+            restaurados += 1
+
+        print(f"✅ Sistema restaurado exitosamente ({restaurados} archivos reescritos)")
+
+    def _hash_db(self, ruta):
+        with tempfile.TemporaryDirectory(dir=self.backup_dir) as tmpdir:
+            copia = os.path.join(tmpdir, "actual.db")
+            self._copiar_db(ruta, copia)
+            return self._hash(copia)
+
+    def _restaurar_copia_completa(self, backup_path):
+        """Formato antiguo: carpeta backup_<fecha> con la copia completa"""
         for item in os.listdir(backup_path):
             src = os.path.join(backup_path, item)
             dst = os.path.join(self.repo_path, item)
-            
+
             if os.path.exists(dst):
                 if os.path.isfile(dst):
                     os.remove(dst)
                 else:
                     shutil.rmtree(dst)
-            
+
             if os.path.isfile(src):
                 shutil.copy2(src, dst)
             else:
                 shutil.copytree(src, dst)
-        
-        print("✅ Sistema restaurado exitosamente")
-    
+
     def ejecutar_pruebas(self):
         """Ejecuta pruebas rápidas antes de activar"""
         print("🧪 Ejecutando pruebas...")
@@ -251,5 +365,5 @@ class SafeUpdater:
 
 if __name__ == "__main__":
     updater = SafeUpdater()
-    updater.menu_principal()o
+    updater.menu_principal()
 
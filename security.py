@@ -1,15 +1,196 @@
+import threading
 import time
 
-_last_action = {}
+from cache import LRUCache
+from database import DEFAULT_DB, get_pool
 
-def can_proceed(user_id, cooldown):
-    now = time.time()
-    last = _last_action.get(user_id, 0)
 
-    if now - last < cooldown:
-        return False
+def _refill(tokens, updated, now, rate, capacity):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class MemoryLimiter:
+    """Token bucket por usuario en memoria, con locks por shard y expiración por rueda de tiempo.
+
+    - Rechazar no toma ningún lock: se lee el estado del bucket y, si no le
+      alcanza para un token, se devuelve False directamente.
+    - Un bucket que vuelve a estar lleno equivale a no tenerlo, así que la
+      rueda de tiempo lo borra: la memoria depende de los usuarios activos
+      en la última ventana, no de todos los que escribieron alguna vez.
+    """
+
+    def __init__(self, rate, capacity=1, shards=16, wheel_slots=64):
+        self.rate = rate
+        self.capacity = capacity
+        self.ttl = capacity / rate
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._tick = max(1.0, self.ttl / (wheel_slots - 1))
+        self._wheel = [set() for _ in range(wheel_slots)]
+        self._wheel_lock = threading.Lock()
+        self._cursor = int(time.monotonic() / self._tick)
+
+    def allow(self, key, now=None):
+        now = now or time.monotonic()
+        buckets, lock = self._shards[hash(key) % len(self._shards)]
+        state = buckets.get(key)
+        if state is not None and _refill(state[0], state[1], now, self.rate, self.capacity) < 1:
+            return False
+        with lock:
+            tokens, updated = buckets.get(key, (self.capacity, now))
+            tokens = _refill(tokens, updated, now, self.rate, self.capacity)
+            if tokens < 1:
+                return False
+            tokens -= 1
+            buckets[key] = (tokens, now)
+            expires = now + (self.capacity - tokens) / self.rate
+        self._schedule(key, expires)
+        self._sweep(now)
+        return True
+
+    def retry_after(self, key, now=None):
+        """Segundos hasta que `key` vuelva a tener un token (0 si ya lo tiene)"""
+        now = now or time.monotonic()
+        buckets, _ = self._shards[hash(key) % len(self._shards)]
+        state = buckets.get(key)
+        if state is None:
+            return 0.0
+        return max(0.0, (1 - _refill(state[0], state[1], now, self.rate, self.capacity)) / self.rate)
+
+    def _schedule(self, key, expires):
+        slot = int(expires / self._tick) + 1
+        with self._wheel_lock:
+            self._wheel[slot % len(self._wheel)].add(key)
+
+    def _sweep(self, now):
+        current = int(now / self._tick)
+        if current <= self._cursor:
+            return
+        with self._wheel_lock:
+            start, self._cursor = self._cursor, current
+            steps = min(current - start, len(self._wheel))
+            expired = []
+            for i in range(1, steps + 1):
+                slot = self._wheel[(start + i) % len(self._wheel)]
+                expired.extend(slot)
+                slot.clear()
+        for key in expired:
+            buckets, lock = self._shards[hash(key) % len(self._shards)]
+            with lock:
+                state = buckets.get(key)
+                if state is None:
+                    continue
+                if _refill(state[0], state[1], now, self.rate, self.capacity) >= self.capacity:
+                    del buckets[key]
+                    continue
+            # Se usó de nuevo después de programarse: vuelve a la rueda
+            self._schedule(key, state[1] + (self.capacity - state[0]) / self.rate)
+
+    def __len__(self):
+        return sum(len(buckets) for buckets, _ in self._shards)
+
+
+class SQLiteLimiter:
+    """Token bucket compartido por todos los workers de gunicorn vía una tabla SQLite.
+
+    Los rechazos recientes se recuerdan en memoria, así que un usuario que
+    insiste no genera escrituras hasta que le toque un token de nuevo.
+    """
+
+    def __init__(self, rate, capacity=1, db_path=DEFAULT_DB, cache_size=10000,
+                 compact_every=1000, compact_batch=500):
+        self.rate = rate
+        self.capacity = capacity
+        self.ttl = capacity / rate
+        self.compact_every = compact_every
+        self.compact_batch = compact_batch
+        self._pool = get_pool(db_path)
+        self._denied = LRUCache(cache_size)
+        self._ready = False
+        self._ops = 0
 
-    _last_action[user_id] = now
-    return True
-	
+    def init_db(self):
+        with self._pool.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL,
+                    updated REAL
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limits_updated ON rate_limits (updated)')
+        self._ready = True
 
+    def allow(self, key, now=None):
+        # time.time(): el reloj tiene que ser común a todos los procesos
+        now = now or time.time()
+        key = str(key)
+        retry_at = self._denied.get(key)
+        if retry_at is not None and now < retry_at:
+            return False
+        if not self._ready:
+            self.init_db()
+
+        conn = self._pool.connection()
+        with conn:
+            # IMMEDIATE: lectura y escritura atómicas frente a los otros workers
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated FROM rate_limits WHERE key = ?', (key,)).fetchone()
+            tokens = _refill(row[0], row[1], now, self.rate, self.capacity) if row else self.capacity
+            allowed = tokens >= 1
+            if allowed:
+                conn.execute(
+                    'INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)',
+                    (key, tokens - 1, now),
+                )
+        if not allowed:
+            self._denied.put(key, now + (1 - tokens) / self.rate)
+            return False
+
+        self._denied.pop(key)
+        self._ops += 1
+        if self._ops % self.compact_every == 0:
+            self.compact(now)
+        return True
+
+    def retry_after(self, key, now=None):
+        """Segundos hasta el próximo token; se lee del rechazo recordado en memoria"""
+        retry_at = self._denied.get(str(key))
+        if retry_at is None:
+            return 0.0
+        return max(0.0, retry_at - (now or time.time()))
+
+    def compact(self, now=None):
+        """Borra por lotes los buckets que ya se rellenaron del todo"""
+        cutoff = (now or time.time()) - self.ttl
+        removed = 0
+        while True:
+            with self._pool.transaction() as conn:
+                cur = conn.execute('''
+                    DELETE FROM rate_limits WHERE key IN (
+                        SELECT key FROM rate_limits WHERE updated < ? LIMIT ?
+                    )
+                ''', (cutoff, self.compact_batch))
+            removed += cur.rowcount
+            if cur.rowcount < self.compact_batch:
+                return removed
+
+
+BACKENDS = {
+    "memory": MemoryLimiter,
+    "sqlite": SQLiteLimiter,
+}
+
+
+def create_limiter(cooldown, burst=1, backend="memory"):
+    """Un token cada `cooldown` segundos, con ráfagas de hasta `burst` mensajes"""
+    return BACKENDS[backend](1.0 / cooldown, burst)
+
+
+_limiters = {}
+
+
+def can_proceed(user_id, cooldown):
+    limiter = _limiters.get(cooldown)
+    if limiter is None:
+        limiter = _limiters.setdefault(cooldown, create_limiter(cooldown))
+    return limiter.allow(user_id)
@@ -0,0 +1,186 @@
+# sender.py
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import TELEGRAM_ERRORS, TELEGRAM_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class SendError(Exception):
+    """Telegram rechazó el mensaje definitivamente (tras reintentos)"""
+
+    def __init__(self, error_code, description):
+        super().__init__(f"{error_code}: {description}")
+        self.error_code = error_code
+        self.description = description
+
+
+def parse_error(data, status):
+    """(error_code, description, retry_after) de una respuesta de la Bot API con ok=false"""
+    return (
+        data.get("error_code", status),
+        data.get("description", ""),
+        (data.get("parameters") or {}).get("retry_after"),
+    )
+
+
+def retry_delay(error_code, retry_after, attempt, max_retries):
+    """Segundos antes del reintento número `attempt` (desde 1), o None si no se reintenta.
+
+    Se reintentan los errores de red (código 0), 429 y 5xx: con 429 se espera
+    lo que pide Telegram y si no, backoff exponencial; ambos con jitter.
+    """
+    retryable = error_code in (0, 429) or error_code >= 500
+    if not retryable or attempt > max_retries:
+        return None
+    if retry_after is not None:
+        return float(retry_after) + random.uniform(0, 0.5)
+    return min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+class TokenBucket:
+    """Cubeta de tokens: `rate` tokens por segundo con ráfagas de hasta `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Reserva un token y devuelve cuántos segundos hay que esperar para usarlo"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def delay(self):
+        """Segundos hasta que haya un token libre, sin reservarlo"""
+        with self._lock:
+            tokens = min(self.capacity, self.tokens + (time.monotonic() - self.last) * self.rate)
+            return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class TelegramSender:
+    """Envío centralizado a la Bot API: pool keep-alive, límites global/por chat y 429"""
+
+    def __init__(self, token, api_url="https://api.telegram.org", global_rate=30, chat_rate=1,
+                 chat_burst=1, pool_size=10, max_retries=3, timeout=10, max_chats=10000):
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}"
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_chats = max_chats
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._global = TokenBucket(global_rate)
+        self._chats = OrderedDict()
+        self._chats_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.counters = {"sent": 0, "throttled": 0, "retried": 0, "failed": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.counters[name] += 1
+
+    def _chat_bucket(self, chat_id):
+        with self._chats_lock:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+                self._chats[chat_id] = bucket
+                # Limitamos memoria: se descarta el chat menos reciente
+                if len(self._chats) > self.max_chats:
+                    self._chats.popitem(last=False)
+            else:
+                self._chats.move_to_end(chat_id)
+            return bucket
+
+    def chat_delay(self, chat_id):
+        """Segundos que faltan para poder escribir a `chat_id` sin esperar su límite"""
+        bucket = self._chats.get(chat_id)
+        return bucket.delay() if bucket is not None else 0.0
+
+    def call(self, method, payload, chat_id=None):
+        """Llama a un método de la Bot API respetando límites y retry_after"""
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                self._chat_bucket(chat_id).acquire()
+            self._global.acquire()
+            start = time.perf_counter()
+            try:
+                resp = self.session.post(f"{self.base_url}/{method}", json=payload, timeout=self.timeout)
+                data = resp.json()
+            except (requests.RequestException, ValueError) as e:
+                error_code, description, retry_after = 0, str(e), None
+            else:
+                TELEGRAM_LATENCY.labels(method).observe(time.perf_counter() - start)
+                if data.get("ok"):
+                    return data.get("result")
+                error_code, description, retry_after = parse_error(data, resp.status_code)
+
+            TELEGRAM_ERRORS.labels(method, error_code).inc()
+            if error_code == 429:
+                self._count("throttled")
+            attempt += 1
+            delay = retry_delay(error_code, retry_after, attempt, self.max_retries)
+            if delay is None:
+                self._count("failed")
+                raise SendError(error_code, description)
+
+            self._count("retried")
+            logger.warning("⏳ Telegram %s error %s, reintento %s en %.2fs", method, error_code, attempt, delay)
+            time.sleep(delay)
+
+    def send_message(self, chat_id, text, parse_mode=None, reply_to_message_id=None, **extra):
+        payload = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if reply_to_message_id:
+            payload["reply_to_message_id"] = reply_to_message_id
+        payload.update(extra)
+        result = self.call("sendMessage", payload, chat_id=chat_id)
+        self._count("sent")
+        return result
+
+    def send_prepared(self, chat_id, prepared, reply_to_message_id=None):
+        """Envía un payload preparado de antemano (ver router.prepare)"""
+        payload = prepared.copy()
+        payload["chat_id"] = chat_id
+        if reply_to_message_id:
+            payload["reply_to_message_id"] = reply_to_message_id
+        result = self.call("sendMessage", payload, chat_id=chat_id)
+        self._count("sent")
+        return result
+
+    def reply_to(self, message, text, **kwargs):
+        """Responde a un mensaje tal como llega en el update de Telegram (dict)"""
+        return self.send_message(message['chat']['id'], text, reply_to_message_id=message['message_id'], **kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.counters)
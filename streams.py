@@ -0,0 +1,74 @@
+# streams.py
+import json
+import queue
+import threading
+from collections import deque
+
+
+def format_sse(event, data, event_id=None):
+    """Serializa un evento Server-Sent Events (se codifica una vez para todos los clientes)"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class Subscriber:
+    """Cola de un cliente: pares (event_id, mensaje ya serializado)"""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = False
+
+
+class EventHub:
+    """Publicador único con fan-out a todos los clientes SSE conectados.
+
+    Guarda los últimos `history` eventos para que un cliente que reconecta
+    con `Last-Event-ID` reciba solo lo que se perdió. Un cliente demasiado
+    lento (cola llena) se desconecta en vez de frenar al resto.
+
+    Cada cliente ocupa un hilo del servidor mientras está conectado, así que
+    `max_subscribers` pone un tope: pasado ese número `subscribe` devuelve
+    (None, None) y el resto de hilos queda libre para las demás rutas.
+    """
+
+    def __init__(self, history=256, client_queue=100, max_subscribers=None):
+        self.client_queue = client_queue
+        self.max_subscribers = max_subscribers
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event, data, event_id):
+        message = format_sse(event, data, event_id)
+        with self._lock:
+            self._history.append((event_id, message))
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait((event_id, message))
+            except queue.Full:
+                sub.dropped = True
+                self.unsubscribe(sub)
+
+    def subscribe(self, last_event_id=None):
+        """Devuelve (suscriptor, pendientes); pendientes es None si hay que reenviar la foto completa"""
+        sub = Subscriber(self.client_queue)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                return None, None
+            self._subscribers.add(sub)
+            backlog = None
+            if last_event_id is not None and self._history and self._history[0][0] <= last_event_id + 1:
+                backlog = [message for event_id, message in self._history if event_id > last_event_id]
+        return sub, backlog
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def __len__(self):
+        return len(self._subscribers)
@@ -0,0 +1,236 @@
+# workers.py
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("block", "drop_new", "drop_oldest")
+
+# Desempate estable en el heap de claves apartadas
+_sequence = itertools.count()
+
+
+class WorkerPool:
+    """Cola acotada + hilos de fondo que la vacían llamando a `handler(item)`"""
+
+    def __init__(self, name, handler, maxsize=1000, workers=2, policy="block", timeout=0.5):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de cola desconocida: {policy}")
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+        self.timeout = timeout
+        self.workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, item):
+        """Encola sin bloquear la petición; devuelve False si la cola rechazó el item"""
+        if not self._threads:
+            self.start()
+        try:
+            if self.policy == "block":
+                self._queue.put(item, timeout=self.timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.policy != "drop_oldest":
+                self.dropped += 1
+                return False
+            # Sacrificamos el evento más antiguo para dejar sitio al nuevo
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        self.accepted += 1
+        return True
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """Espera a que se procese todo lo encolado (útil en scripts y apagado)"""
+        self._queue.join()
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("❌ Error en worker %s: %s", self.name, e)
+            finally:
+                self._queue.task_done()
+
+
+class KeyedWorkerPool:
+    """Items en orden por clave (p. ej. el chat) sobre un pool de hilos compartido.
+
+    Cada clave tiene su propia cola (deque) y está como mucho una vez en la
+    cola de claves listas, así que nunca la atienden dos hilos a la vez y sus
+    items se procesan en orden de llegada. Tras cada item la clave vuelve al
+    final de la cola: un chat con mucho tráfico no acapara un hilo.
+
+    `delay(key)` (opcional) devuelve cuántos segundos hay que esperar antes
+    de atender la clave (p. ej. el límite de 1 mensaje/s por chat de
+    Telegram). Esa espera no ocupa un hilo: la clave se aparta y vuelve a la
+    cola cuando vence, mientras los hilos siguen con los demás chats.
+    """
+
+    def __init__(self, name, handler, workers=4, maxsize=1000, timeout=0.5, delay=None):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.delay = delay
+        self._pending = {}
+        self._ready = queue.Queue()
+        self._delayed = []
+        self._count = 0
+        self._threads = []
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._timer = threading.Condition(threading.Lock())
+        self.accepted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        self.deferred = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            if self.delay is not None:
+                t = threading.Thread(target=self._run_timer, name=f"{self.name}-timer", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, key, item):
+        """Encola sin bloquear más de `timeout`; devuelve False si la cola está llena"""
+        if not self._threads:
+            self.start()
+        with self._not_full:
+            if self._count >= self.maxsize:
+                self._not_full.wait_for(lambda: self._count < self.maxsize, self.timeout)
+                if self._count >= self.maxsize:
+                    self.dropped += 1
+                    return False
+            self._count += 1
+            self.accepted += 1
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.append(item)
+                return True
+            self._pending[key] = deque([item])
+        self._ready.put(key)
+        return True
+
+    def depth(self):
+        return self._count
+
+    def join(self):
+        """Espera a que se procese todo lo encolado (útil en scripts y apagado)"""
+        with self._idle:
+            self._idle.wait_for(lambda: self._count == 0)
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+            "deferred": self.deferred,
+        }
+
+    def _defer(self, key, seconds):
+        with self._timer:
+            heapq.heappush(self._delayed, (time.monotonic() + seconds, next(_sequence), key))
+            self._timer.notify()
+
+    def _run_timer(self):
+        # Devuelve a la cola de listas las claves apartadas cuando vence su espera
+        with self._timer:
+            while True:
+                if not self._delayed:
+                    self._timer.wait()
+                    continue
+                wait = self._delayed[0][0] - time.monotonic()
+                if wait > 0:
+                    self._timer.wait(wait)
+                    continue
+                self._ready.put(heapq.heappop(self._delayed)[2])
+
+    def _run(self):
+        while True:
+            key = self._ready.get()
+            if self.delay is not None:
+                wait = self.delay(key)
+                if wait > 0:
+                    self.deferred += 1
+                    self._defer(key, wait)
+                    continue
+            with self._lock:
+                item = self._pending[key].popleft()
+            try:
+                self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("❌ Error en worker %s: %s", self.name, e)
+            with self._lock:
+                self._count -= 1
+                self._not_full.notify()
+                if self._count == 0:
+                    self._idle.notify_all()
+                if self._pending[key]:
+                    again = True
+                else:
+                    del self._pending[key]
+                    again = False
+            if again:
+                self._ready.put(key)